@@ -0,0 +1,266 @@
+"""
+Band normalization for cell/band strings (2G/3G/4G/5G).
+
+Patterns are compiled once and tried in order; results are memoized per distinct
+input string. Extra vendor patterns can be registered with register_band_pattern()
+or listed in the JSON file named by BAND_PATTERNS_FILE, e.g.
+
+    [{"name": "Huawei LTE", "pattern": "LTE(\\d{3,4})", "format": "L\\1"}]
+
+Registered patterns run on every /query row, so they are length-limited, rejected when
+they could backtrack catastrophically (nested quantifiers, alternation under a
+quantifier, backreferences), and only see the first BAND_MATCH_MAX_CHARS characters of a
+value. Patterns registered with persist=True are kept in BAND_PATTERNS_STORE, which
+every worker re-reads when it changes; band_patterns_version() fingerprints the active
+list for cache keys.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse
+
+from geo_features import map_distinct
+
+logger = logging.getLogger(__name__)
+
+BAND_CACHE_SIZE = int(os.getenv("BAND_CACHE_SIZE", "8192"))
+BAND_PATTERNS_FILE = os.getenv("BAND_PATTERNS_FILE")
+# Patterns registered through the API, shared by every worker and kept across restarts
+BAND_PATTERNS_STORE = os.getenv("BAND_PATTERNS_STORE",
+                                os.path.join(os.getenv("DATA_DIR", "./data"), "band_patterns.json"))
+# Seconds between checks of BAND_PATTERNS_STORE for patterns added by other workers
+BAND_PATTERNS_SYNC_SECONDS = float(os.getenv("BAND_PATTERNS_SYNC_SECONDS", "5"))
+BAND_PATTERN_MAX_LENGTH = int(os.getenv("BAND_PATTERN_MAX_LENGTH", "200"))
+# Characters of a value a registered pattern is matched against
+BAND_MATCH_MAX_CHARS = int(os.getenv("BAND_MATCH_MAX_CHARS", "64"))
+
+# (name, compiled pattern, Match.expand() template, max input chars) — tried in this order
+_BUILTIN_PATTERNS = (
+    # 5G pattern: N78, N41, N28, etc.
+    ("5G", re.compile(r"\bN\d{2,4}\b"), r"\g<0>", None),
+    # 4G LTE pattern: L800, L1800, L2100, etc.
+    ("4G", re.compile(r"\bL\d{2,4}\b"), r"\g<0>", None),
+    # 3G UMTS/WCDMA pattern: U900, U2100, W2100, etc.
+    ("3G", re.compile(r"\b[UW]\d{3,4}\b"), r"\g<0>", None),
+    # 2G GSM pattern: G900, G1800, etc.
+    ("2G", re.compile(r"\bG\d{3,4}\b"), r"\g<0>", None),
+)
+# Fallback: “Band 8”, “BAND8” → “B8”
+_FALLBACK_PATTERN = ("BAND", re.compile(r"BAND\s?(\d+)"), r"B\1", None)
+
+_leading_patterns = ()
+_extra_patterns = ()
+_stored_entries = []  # BAND_PATTERNS_STORE contents as last read or written
+_store_mtime = None
+_store_checked_at = 0.0
+_patterns = _BUILTIN_PATTERNS + (_FALLBACK_PATTERN,)
+_version = None
+_patterns_lock = threading.Lock()
+
+_REPEATS = (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT) + (
+    (_sre_parse.POSSESSIVE_REPEAT,) if hasattr(_sre_parse, "POSSESSIVE_REPEAT") else ())
+_BACKREFS = (_sre_parse.GROUPREF, _sre_parse.GROUPREF_EXISTS)
+
+
+@lru_cache(maxsize=BAND_CACHE_SIZE)
+def _normalize_key(s: str):
+    for _, pattern, template, max_chars in _patterns:
+        m = pattern.search(s if max_chars is None else s[:max_chars])
+        if m:
+            try:
+                return m.expand(template)
+            except (re.error, IndexError):
+                # Bad template on a registered pattern: skip it rather than fail the request
+                continue
+    return None
+
+
+def extract_band(val):
+    """
+    Extracts normalized band identifiers for 2G/3G/4G/5G.
+    Examples handled:
+      - N78, N41 (5G)
+      - L800, L1800, L2100 (4G)
+      - U900, W2100 (3G)
+      - G900, G1800 (2G)
+      - BAND 8, Band 1 → B8, B1
+    plus any registered vendor patterns.
+    """
+    if not val:
+        return None
+    return _normalize_key(str(val).upper().replace(" ", ""))
+
+
+def normalize_band_series(series):
+    """Column-wise extract_band(), evaluated once per distinct value."""
+    return map_distinct(series, extract_band)
+
+
+def _check_backtracking(items, repeated: bool = False):
+    """Raises ValueError on constructs that can backtrack exponentially."""
+    for op, av in items:
+        if op in _REPEATS:
+            lo, hi, sub = av
+            # A fixed count (\d{2}) inside a quantifier cannot split its input more than one way
+            if repeated and hi > 1 and lo != hi:
+                raise ValueError("nested quantifiers are not allowed")
+            _check_backtracking(sub, repeated or hi > 1)
+        elif op in _BACKREFS:
+            raise ValueError("backreferences are not allowed")
+        elif op is _sre_parse.BRANCH:
+            if repeated:
+                raise ValueError("alternation inside a quantified group is not allowed")
+            for branch in av[1]:
+                _check_backtracking(branch, repeated)
+        elif op is _sre_parse.SUBPATTERN:
+            _check_backtracking(av[-1], repeated)
+        elif op in (_sre_parse.ASSERT, _sre_parse.ASSERT_NOT):
+            _check_backtracking(av[1], repeated)
+        elif getattr(_sre_parse, "ATOMIC_GROUP", None) is op:
+            _check_backtracking(av, repeated)
+
+
+def compile_band_pattern(pattern: str):
+    """Compiles a registered pattern, raising ValueError if it is too long or unsafe."""
+    if not isinstance(pattern, str) or len(pattern) > BAND_PATTERN_MAX_LENGTH:
+        raise ValueError(f"Band pattern must be a string of at most {BAND_PATTERN_MAX_LENGTH} characters")
+    try:
+        compiled = re.compile(pattern)
+        _check_backtracking(_sre_parse.parse(pattern))
+    except (re.error, ValueError) as e:
+        raise ValueError(f"Invalid band pattern {pattern!r}: {e}")
+    return compiled
+
+
+def _rebuild():
+    global _patterns, _version
+    _patterns = _leading_patterns + _BUILTIN_PATTERNS + _extra_patterns + (_FALLBACK_PATTERN,)
+    _version = hashlib.sha1(json.dumps(list_band_patterns()).encode("utf-8")).hexdigest()[:12]
+    _normalize_key.cache_clear()
+
+
+def register_band_pattern(pattern: str, template: str = r"\g<0>", name: str = None, first: bool = False,
+                          persist: bool = False):
+    """
+    Adds a vendor band pattern. It is matched against the upper-cased, space-stripped
+    value and its result is built with Match.expand(template) (e.g. "L\\1").
+    Registered patterns run after the built-in 2G–5G ones and before the "BAND n"
+    fallback, or before everything with first=True. With persist=True it is also
+    written to BAND_PATTERNS_STORE. Raises ValueError on a bad pattern.
+    """
+    global _leading_patterns, _extra_patterns
+    compiled = compile_band_pattern(pattern)
+    entry = (name or pattern, compiled, template, BAND_MATCH_MAX_CHARS)
+    with _patterns_lock:
+        if persist:
+            # Re-read first so patterns added by other workers are kept
+            _sync_store(force=True)
+            entries = _stored_entries + [{"name": entry[0], "pattern": pattern, "format": template, "first": first}]
+            _write_store(entries)
+            _stored_entries[:] = entries
+        if first:
+            _leading_patterns = _leading_patterns + (entry,)
+        else:
+            _extra_patterns = _extra_patterns + (entry,)
+        _rebuild()
+    return entry[0]
+
+
+def list_band_patterns():
+    return [
+        {"name": name, "pattern": pattern.pattern, "format": template}
+        for name, pattern, template, _ in _patterns
+    ]
+
+
+def band_patterns_version() -> str:
+    """Fingerprint of the active pattern list (picking up BAND_PATTERNS_STORE changes)."""
+    if time.time() - _store_checked_at > BAND_PATTERNS_SYNC_SECONDS:
+        with _patterns_lock:
+            _sync_store()
+    return _version
+
+
+def cache_info():
+    info = _normalize_key.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+
+
+def load_band_patterns_file(path: str):
+    """Registers every {"pattern", "format", "name", "first"} entry of a JSON list file."""
+    with open(path, "r") as f:
+        entries = json.load(f)
+    for entry in entries:
+        register_band_pattern(
+            entry["pattern"],
+            entry.get("format", r"\g<0>"),
+            entry.get("name"),
+            entry.get("first", False),
+        )
+    logger.info(f" Loaded {len(entries)} band patterns from {path}")
+
+
+def _write_store(entries: list):
+    global _store_mtime
+    os.makedirs(os.path.dirname(BAND_PATTERNS_STORE) or ".", exist_ok=True)
+    tmp = f"{BAND_PATTERNS_STORE}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp, BAND_PATTERNS_STORE)
+    _store_mtime = os.stat(BAND_PATTERNS_STORE).st_mtime_ns
+
+
+def _sync_store(force: bool = False):
+    """Applies BAND_PATTERNS_STORE entries not registered here yet; call with _patterns_lock held."""
+    global _leading_patterns, _extra_patterns, _store_mtime, _store_checked_at
+    _store_checked_at = time.time()
+    try:
+        mtime = os.stat(BAND_PATTERNS_STORE).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if mtime == _store_mtime and not force:
+        return
+    try:
+        with open(BAND_PATTERNS_STORE, "r") as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f" Could not read BAND_PATTERNS_STORE={BAND_PATTERNS_STORE}: {e}")
+        return
+    _store_mtime = mtime
+    # The store only grows, so entries past the ones already applied are new
+    added = 0
+    for entry in entries[len(_stored_entries):]:
+        try:
+            compiled = compile_band_pattern(entry["pattern"])
+        except (KeyError, ValueError) as e:
+            logger.error(f" Skipping stored band pattern {entry!r}: {e}")
+            continue
+        item = (entry.get("name") or entry["pattern"], compiled, entry.get("format", r"\g<0>"), BAND_MATCH_MAX_CHARS)
+        if entry.get("first"):
+            _leading_patterns = _leading_patterns + (item,)
+        else:
+            _extra_patterns = _extra_patterns + (item,)
+        added += 1
+    _stored_entries[:] = entries
+    if added:
+        _rebuild()
+        logger.info(f" Loaded {added} band patterns from {BAND_PATTERNS_STORE}")
+
+
+_rebuild()
+if BAND_PATTERNS_FILE:
+    try:
+        load_band_patterns_file(BAND_PATTERNS_FILE)
+    except Exception as e:
+        logger.error(f" Could not load BAND_PATTERNS_FILE={BAND_PATTERNS_FILE}: {e}")
+with _patterns_lock:
+    _sync_store()
@@ -0,0 +1,86 @@
+"""
+Benchmark: /query feature construction, iterrows() loop vs geo_features columnar builder.
+
+    python benchmarks/bench_query_features.py [rows]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bands import extract_band, normalize_band_series  # noqa: E402
+from geo_features import build_point_features  # noqa: E402
+
+
+def legacy_features(df):
+    """The per-row loop /query used before the columnar builder."""
+    features, all_bands = [], set()
+    for _, r in df.iterrows():
+        try:
+            lon, lat = float(r["Long"]), float(r["Lat"])
+            if not np.isfinite(lon) or not np.isfinite(lat):
+                continue
+            props = {k: (None if pd.isna(v) else v) for k, v in r.items()}
+            norm_band = extract_band(props.get("band") or props.get("cellname"))
+            if norm_band:
+                props["band"] = norm_band
+                all_bands.add(norm_band)
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "properties": props
+            })
+        except Exception:
+            continue
+    return features, all_bands
+
+
+def make_frame(rows):
+    rng = np.random.default_rng(7)
+    bands = np.array(["L1800", "N78", "U2100", "G900", "Band 8", "LTE800", None], dtype=object)
+    lat = rng.uniform(50, 55, rows)
+    lat[rng.random(rows) < 0.01] = np.nan
+    return pd.DataFrame({
+        "cellname": [f"CELL{i}_{bands[i % 7]}" for i in range(rows)],
+        "Lat": lat,
+        "Long": rng.uniform(-3, 1, rows),
+        "Azimuth": rng.integers(0, 360, rows),
+        "site_id": [f"S{i // 3}" for i in range(rows)],
+        "band": bands[np.arange(rows) % 7],
+        "city": rng.choice(["London", "Leeds", None], rows),
+        "RSRP": rng.normal(-95, 10, rows),
+        "Throughput": rng.normal(20, 5, rows),
+    })
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    df = make_frame(rows)
+
+    t_old, (old_features, old_bands) = timed(legacy_features, df)
+    t_new, (new_features, new_bands) = timed(
+        lambda d: build_point_features(d, "Long", "Lat", ("band", "cellname"), normalize_band_series), df
+    )
+
+    assert old_features == new_features and old_bands == new_bands, "builders disagree"
+    print(f"rows={rows} features={len(new_features)}")
+    print(f"iterrows loop : {t_old * 1000:8.1f} ms")
+    print(f"columnar      : {t_new * 1000:8.1f} ms")
+    print(f"speedup       : {t_old / t_new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Vectorized square-grid and hexagonal binning of point data.
+
+Square cells are aligned to a global grid (cell ix covers [ix * size, (ix + 1) * size)),
+so a cell index is computed with one floor division per point and cells of different
+datasets line up. Hexagons are laid out in metres in the UTM zone of the data (pointy-top,
+axial q/r coordinates, cube rounding), so their area does not change with latitude.
+Aggregation sorts the points once per KPI; the cost depends on the number of points,
+not on the area of their bounding box, and only occupied cells exist.
+"""
+import math
+
+import numpy as np
+from pyproj import Transformer
+
+GRID_STATS = ("mean", "median", "p10", "p90", "min", "max", "count")
+_QUANTILES = {"median": 0.5, "p10": 0.1, "p90": 0.9}
+
+
+def parse_stats(stats) -> tuple:
+    """Comma-separated or iterable stat names, validated against GRID_STATS (all by default)."""
+    if not stats:
+        return GRID_STATS
+    names = [s.strip().lower() for s in (stats.split(",") if isinstance(stats, str) else stats) if s.strip()]
+    unknown = [s for s in names if s not in GRID_STATS]
+    if unknown:
+        raise ValueError(f"Unknown stats {unknown}; expected any of {list(GRID_STATS)}")
+    return tuple(dict.fromkeys(names))
+
+
+def square_cells(lon, lat, cell_size: float):
+    """Integer cell indices (ix, iy) of every point; non-finite coordinates give no cell (mask False)."""
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    mask = np.isfinite(lon) & np.isfinite(lat)
+    ix = np.floor(lon[mask] / cell_size).astype(np.int64)
+    iy = np.floor(lat[mask] / cell_size).astype(np.int64)
+    return ix, iy, mask
+
+
+def cell_keys(ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+    """
+    One int64 per (ix, iy) pair; see split_keys(). Raises ValueError when an index does not
+    fit in 32 bits (a cell size far too small for the extent), as keys would collide.
+    """
+    for idx in (ix, iy):
+        if len(idx) and (idx.min() < -(1 << 31) or idx.max() >= (1 << 31)):
+            raise ValueError("Cell size too small for the data extent: cell indices exceed 32 bits")
+    return ((ix + (1 << 31)) << 32) | (iy + (1 << 31))
+
+
+def split_keys(keys: np.ndarray):
+    """Inverse of cell_keys()."""
+    return ((keys >> 32) & 0xFFFFFFFF) - (1 << 31), (keys & 0xFFFFFFFF) - (1 << 31)
+
+
+def group_quantiles(sorted_values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """
+    Per-group quantile (linear interpolation, as np.quantile) for values sorted within
+    contiguous groups given by starts/counts; groups must be non-empty.
+    """
+    pos = starts + q * (counts - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def aggregate_cells(keys: np.ndarray, values: dict = None, stats=GRID_STATS) -> dict:
+    """
+    Aggregates points by cell key. Returns column arrays: "key", "count" (points per cell)
+    and "<kpi>_<stat>" for every KPI in values (name → float array aligned with keys,
+    NaN = missing) and stat in stats. Cells where a KPI has no value get NaN (count 0).
+    """
+    cells, inverse, count = np.unique(keys, return_inverse=True, return_counts=True)
+    out = {"key": cells, "count": count}
+    for name, v in (values or {}).items():
+        v = np.asarray(v, dtype=float)
+        valid = ~np.isnan(v)
+        n = np.bincount(inverse[valid], minlength=len(cells))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if "mean" in stats:
+                out[f"{name}_mean"] = np.where(n > 0, np.bincount(inverse[valid], weights=v[valid], minlength=len(cells)) / n, np.nan)
+        if "count" in stats:
+            out[f"{name}_count"] = n
+
+        order_stats = [s for s in stats if s in _QUANTILES or s in ("min", "max")]
+        if not order_stats:
+            continue
+        # Sort by (cell, value) once; every order statistic is then an index into each run
+        cell_of = inverse[valid]
+        order = np.lexsort((v[valid], cell_of))
+        sorted_values = v[valid][order]
+        has = n > 0
+        starts = np.concatenate(([0], np.cumsum(n[has])[:-1]))
+        for stat in order_stats:
+            col = np.full(len(cells), np.nan)
+            if stat == "min":
+                col[has] = sorted_values[starts]
+            elif stat == "max":
+                col[has] = sorted_values[starts + n[has] - 1]
+            else:
+                col[has] = group_quantiles(sorted_values, starts, n[has], _QUANTILES[stat])
+            out[f"{name}_{stat}"] = col
+    return out
+
+
+def square_grid(lon, lat, values: dict, cell_size: float, stats=GRID_STATS) -> dict:
+    """aggregate_cells() on a square grid of cell_size (in the coordinates' units); adds ix/iy."""
+    ix, iy, mask = square_cells(lon, lat, cell_size)
+    values = {k: np.asarray(v, dtype=float)[mask] for k, v in (values or {}).items()}
+    out = aggregate_cells(cell_keys(ix, iy), values, stats)
+    out["ix"], out["iy"] = split_keys(out.pop("key"))
+    return out
+
+
+def square_grid_features(cols: dict, cell_size: float, extra: dict = None) -> list:
+    """
+    Polygon features for square_grid() output. Properties are every aggregate column
+    (NaN → None) plus extra (property name → column name) aliases.
+    """
+    ix, iy = cols["ix"].tolist(), cols["iy"].tolist()
+    names = [k for k in cols if k not in ("ix", "iy")]
+    columns = [[None if v != v else v for v in cols[k].tolist()] for k in names]
+    aliases = [(alias, names.index(src)) for alias, src in (extra or {}).items() if src in names]
+    features = []
+    for i, (x, y) in enumerate(zip(ix, iy)):
+        x0, y0 = x * cell_size, y * cell_size
+        x1, y1 = x0 + cell_size, y0 + cell_size
+        props = {name: column[i] for name, column in zip(names, columns)}
+        for alias, j in aliases:
+            props[alias] = columns[j][i]
+        features.append({
+            "type": "Feature",
+            "id": f"{x}:{y}",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[x1, y0], [x1, y1], [x0, y1], [x0, y0], [x1, y0]]],
+            },
+            "properties": props,
+        })
+    return features
+
+
+# === Hexagons (metric) ===
+_SQRT3 = math.sqrt(3.0)
+
+
+def utm_epsg(lon, lat) -> int:
+    """EPSG code of the UTM zone holding the median point (326xx north, 327xx south)."""
+    lon0 = float(np.nanmedian(lon))
+    lat0 = float(np.nanmedian(lat))
+    zone = min(int((lon0 + 180.0) // 6) + 1, 60)
+    return (32600 if lat0 >= 0 else 32700) + zone
+
+
+def _transformers(epsg: int):
+    return (
+        Transformer.from_crs(4326, epsg, always_xy=True),
+        Transformer.from_crs(epsg, 4326, always_xy=True),
+    )
+
+
+def hex_cells(x: np.ndarray, y: np.ndarray, size: float):
+    """Axial (q, r) of the pointy-top hexagon of circumradius size containing each point."""
+    fq = (_SQRT3 / 3.0 * x - y / 3.0) / size
+    fr = (2.0 / 3.0 * y) / size
+    fs = -fq - fr
+    q, r, s = np.round(fq), np.round(fr), np.round(fs)
+    dq, dr, ds = np.abs(q - fq), np.abs(r - fr), np.abs(s - fs)
+    # Cube rounding: the coordinate with the largest rounding error is rebuilt from the others
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q = np.where(fix_q, -r - s, q)
+    r = np.where(fix_r, -q - s, r)
+    return q.astype(np.int64), r.astype(np.int64)
+
+
+def hex_ids(q: np.ndarray, r: np.ndarray) -> np.ndarray:
+    """
+    Compact non-negative id per (q, r) below 2 ** 52, so it survives a JavaScript number
+    (|q|, |r| < 2 ** 25, i.e. any UTM zone down to 1 m hexagons).
+    """
+    return ((q + (1 << 25)) << 26) | (r + (1 << 25))
+
+
+def split_hex_ids(ids: np.ndarray):
+    """Inverse of hex_ids()."""
+    return (ids >> 26) - (1 << 25), (ids & ((1 << 26) - 1)) - (1 << 25)
+
+
+def hex_centers(q: np.ndarray, r: np.ndarray, size: float):
+    return size * (_SQRT3 * q + _SQRT3 / 2.0 * r), size * 1.5 * r
+
+
+def hex_grid(lon, lat, values: dict, size_m: float, stats=GRID_STATS, epsg: int = None) -> dict:
+    """
+    aggregate_cells() on hexagons of circumradius size_m metres in UTM zone epsg (by
+    default the zone of the data). Adds q/r, "hex" (compact id, see hex_ids()) and the
+    lon/lat of every hexagon centre; the zone is returned as "epsg".
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    mask = np.isfinite(lon) & np.isfinite(lat)
+    epsg = epsg or (utm_epsg(lon[mask], lat[mask]) if mask.any() else 32631)
+    forward, inverse = _transformers(epsg)
+    x, y = forward.transform(lon[mask], lat[mask])
+    q, r = hex_cells(np.asarray(x), np.asarray(y), size_m)
+    values = {k: np.asarray(v, dtype=float)[mask] for k, v in (values or {}).items()}
+
+    out = aggregate_cells(hex_ids(q, r), values, stats)
+    out["hex"] = out.pop("key")
+    out["q"], out["r"] = split_hex_ids(out["hex"])
+    cx, cy = hex_centers(out["q"], out["r"], size_m)
+    out["lon"], out["lat"] = (np.asarray(a) for a in inverse.transform(cx, cy))
+    out["epsg"] = epsg
+    return out
+
+
+def hex_grid_features(cols: dict, size_m: float, extra: dict = None) -> list:
+    """
+    Polygon features (lon/lat rings) for hex_grid() output, id = the compact hex id.
+    Properties are every aggregate column (NaN → None) plus extra aliases.
+    """
+    _, inverse = _transformers(cols["epsg"])
+    cx, cy = hex_centers(cols["q"], cols["r"], size_m)
+    angles = np.radians(30.0 + 60.0 * np.arange(7))  # pointy-top corners, ring closed
+    rx = cx[:, None] + size_m * np.cos(angles)[None, :]
+    ry = cy[:, None] + size_m * np.sin(angles)[None, :]
+    rlon, rlat = inverse.transform(rx.ravel(), ry.ravel())
+    rings = np.stack([np.asarray(rlon), np.asarray(rlat)], axis=1).reshape(len(cx), 7, 2).tolist()
+
+    skip = ("hex", "q", "r", "lon", "lat", "epsg")
+    names = [k for k in cols if k not in skip]
+    columns = [[None if v != v else v for v in cols[k].tolist()] for k in names]
+    aliases = [(alias, names.index(src)) for alias, src in (extra or {}).items() if src in names]
+    features = []
+    for i, (hex_id, ring) in enumerate(zip(cols["hex"].tolist(), rings)):
+        props = {name: column[i] for name, column in zip(names, columns)}
+        for alias, j in aliases:
+            props[alias] = columns[j][i]
+        features.append({
+            "type": "Feature",
+            "id": hex_id,
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+            "properties": props,
+        })
+    return features
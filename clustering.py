@@ -0,0 +1,152 @@
+"""
+Zoom-dependent point clustering on a Web Mercator grid.
+
+Points are binned into cell_px × cell_px screen cells at the finest zoom; every coarser
+zoom merges 2×2 cells of the level below. Building the hierarchy is one pass over the
+points plus one pass per zoom over the (shrinking) cell arrays, and a response at any
+zoom holds at most one cluster per cell of the viewport.
+"""
+import math
+
+import numpy as np
+
+TILE_PX = 256
+MAX_LAT = 85.0511287798
+
+
+def mercator_unit(lon: np.ndarray, lat: np.ndarray):
+    """lon/lat → Web Mercator coordinates scaled to [0, 1) (origin top-left)."""
+    lat = np.clip(lat, -MAX_LAT, MAX_LAT)
+    mx = (lon + 180.0) / 360.0
+    s = np.sin(np.radians(lat))
+    my = 0.5 - np.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return np.clip(mx, 0.0, np.nextafter(1.0, 0.0)), np.clip(my, 0.0, np.nextafter(1.0, 0.0))
+
+
+class ClusterLevel:
+    """Clusters of one zoom: cell ids, point counts, coordinate sums and per-KPI n/sum/min/max."""
+
+    __slots__ = ("cx", "cy", "count", "lon_sum", "lat_sum", "stats")
+
+    def __init__(self, cx, cy, count, lon_sum, lat_sum, stats):
+        self.cx, self.cy = cx, cy
+        self.count = count
+        self.lon_sum, self.lat_sum = lon_sum, lat_sum
+        self.stats = stats  # kpi → (n, sum, min, max)
+
+    def __len__(self):
+        return len(self.count)
+
+    def merge(self, shift: int = 1) -> "ClusterLevel":
+        """The next coarser level: cells whose ids agree after >> shift are merged."""
+        cx, cy = self.cx >> shift, self.cy >> shift
+        if not len(cx):
+            return ClusterLevel(cx, cy, self.count, self.lon_sum, self.lat_sum, self.stats)
+        key = (cx << 32) | cy
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+
+        def add(a):
+            return np.add.reduceat(a[order], starts)
+
+        stats = {
+            name: (add(n), add(total), np.fmin.reduceat(lo[order], starts), np.fmax.reduceat(hi[order], starts))
+            for name, (n, total, lo, hi) in self.stats.items()
+        }
+        return ClusterLevel(cx[order][starts], cy[order][starts], add(self.count),
+                            add(self.lon_sum), add(self.lat_sum), stats)
+
+
+class ClusterIndex:
+    """
+    Per-zoom cluster hierarchy for a point dataset. values maps KPI name → numeric array
+    (NaN = missing). Zooms above max_zoom return the individual points.
+    """
+
+    def __init__(self, lon, lat, values: dict = None, min_zoom: int = 0, max_zoom: int = 16, cell_px: int = 64):
+        if cell_px not in (1, 2, 4, 8, 16, 32, 64, 128, 256):
+            raise ValueError("cell_px must be a power of two up to 256")
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        values = {k: np.asarray(v, dtype=float) for k, v in (values or {}).items()}
+
+        keep = np.isfinite(lon) & np.isfinite(lat)
+        self.lon, self.lat = lon[keep], lat[keep]
+        self.values = {k: v[keep] for k, v in values.items()}
+        self.kpis = list(self.values)
+        self.min_zoom, self.max_zoom, self.cell_px = min_zoom, max_zoom, cell_px
+
+        # Cells per axis at zoom z: 2 ** (z + cell_bits)
+        self.cell_bits = int(math.log2(TILE_PX // cell_px))
+        mx, my = mercator_unit(self.lon, self.lat)
+        scale = float(2 ** (max_zoom + self.cell_bits))
+        leaf = ClusterLevel(
+            (mx * scale).astype(np.int64), (my * scale).astype(np.int64),
+            np.ones(len(self.lon), dtype=np.int64), self.lon.copy(), self.lat.copy(),
+            {
+                k: ((~np.isnan(v)).astype(np.int64), np.nan_to_num(v, nan=0.0), v, v)
+                for k, v in self.values.items()
+            },
+        )
+        self.levels = {max_zoom: leaf.merge(0)}
+        for z in range(max_zoom - 1, min_zoom - 1, -1):
+            self.levels[z] = self.levels[z + 1].merge()
+
+    @property
+    def point_count(self) -> int:
+        return len(self.lon)
+
+    def clusters(self, zoom: int, bbox=None) -> dict:
+        """
+        Column arrays for the clusters at zoom (clamped to min_zoom), optionally restricted
+        to bbox = (min_lon, min_lat, max_lon, max_lat) by cluster centroid.
+        """
+        zoom = max(int(zoom), self.min_zoom)
+        if zoom > self.max_zoom:
+            n = len(self.lon)
+            out = {"lon": self.lon, "lat": self.lat, "count": np.ones(n, dtype=np.int64)}
+            for k, v in self.values.items():
+                out[f"{k}_mean"] = out[f"{k}_min"] = out[f"{k}_max"] = v
+        else:
+            level = self.levels[zoom]
+            count = level.count
+            out = {"lon": level.lon_sum / count, "lat": level.lat_sum / count, "count": count}
+            for k, (n, total, lo, hi) in level.stats.items():
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    out[f"{k}_mean"] = np.where(n > 0, total / np.maximum(n, 1), np.nan)
+                out[f"{k}_min"], out[f"{k}_max"] = lo, hi
+
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            mask = (out["lon"] >= min_lon) & (out["lon"] <= max_lon) & (out["lat"] >= min_lat) & (out["lat"] <= max_lat)
+            out = {k: v[mask] for k, v in out.items()}
+        return out
+
+    def to_geojson(self, zoom: int, bbox=None, limit: int = None) -> dict:
+        """
+        FeatureCollection of clusters; properties: cluster, point_count, <kpi>_mean/_min/_max.
+        With limit, at most that many features are returned (the largest clusters first,
+        ties in index order); "matched" is the count before the cut and "truncated" says
+        whether it applied.
+        """
+        cols = self.clusters(zoom, bbox)
+        matched = len(cols["count"])
+        truncated = limit is not None and matched > limit
+        if truncated:
+            keep = np.sort(np.argsort(-cols["count"], kind="stable")[:limit])
+            cols = {k: v[keep] for k, v in cols.items()}
+        lon, lat, count = cols.pop("lon").tolist(), cols.pop("lat").tolist(), cols.pop("count").tolist()
+        names = list(cols)
+        stats = [[None if math.isnan(v) else v for v in cols[name].tolist()] for name in names]
+        features = []
+        for i, (x, y, c) in enumerate(zip(lon, lat, count)):
+            props = {"cluster": c > 1, "point_count": c}
+            for name, column in zip(names, stats):
+                props[name] = column[i]
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [x, y]},
+                "properties": props,
+            })
+        return {"type": "FeatureCollection", "features": features, "matched": matched, "truncated": truncated}
@@ -0,0 +1,267 @@
+"""
+Per-column statistics for legends and threshold sliders: row/null counts, min/max, mean,
+quantiles (p1 … p99) and an equal-width histogram.
+
+- series_stats(): a pandas Series (uploaded datasets).
+- sql_column_stats(): exact, two statements against the table (aggregates + percentile_cont,
+  then width_bucket counts); detail="range" stops after the aggregates.
+- pg_stats_column_stats(): approximate, from the planner statistics ANALYZE keeps in
+  pg_stats (equal-frequency histogram bounds plus most common values); reads no table rows.
+- ColumnStatsCache: results keyed by table/dataset and column, dropped when the change
+  marker of their table moves.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from geo_features import widen_float32
+
+STAT_QUANTILES = (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+NUMERIC_SQL_TYPES = {"smallint", "integer", "bigint", "numeric", "real", "double precision", "decimal"}
+
+# Points laid out inside each pg_stats histogram bucket when synthesizing the distribution
+_BUCKET_POINTS = 16
+
+
+def _quantile_names(quantiles=STAT_QUANTILES) -> list:
+    return [f"p{q * 100:g}" for q in quantiles]
+
+
+def _edges(lo: float, hi: float, bins: int) -> np.ndarray:
+    """Equal-width bin edges over [lo, hi]; a constant column gets a single bin."""
+    if hi <= lo:
+        return np.array([lo, hi])
+    return np.linspace(lo, hi, bins + 1)
+
+
+def _clean(value):
+    """float (None for missing/non-finite) with float32 noise removed."""
+    if value is None:
+        return None
+    value = float(str(value)) if isinstance(value, (np.float16, np.float32)) else float(value)
+    return value if np.isfinite(value) else None
+
+
+def _result(rows, count, lo, hi, mean, quantiles=None, edges=None, counts=None, source="exact") -> dict:
+    out = {
+        "rows": int(rows),
+        "count": int(count),
+        "nulls": int(rows - count),
+        "min": _clean(lo),
+        "max": _clean(hi),
+        "mean": _clean(mean),
+        "source": source,
+        "approximate": source == "pg_stats",
+    }
+    if quantiles is not None:
+        out["quantiles"] = {name: _clean(v) for name, v in zip(_quantile_names(), quantiles)}
+    if edges is not None:
+        out["histogram"] = {"edges": [_clean(e) for e in edges], "counts": [int(c) for c in counts]}
+    return out
+
+
+def series_stats(series: pd.Series, bins: int = 32, detail: str = "full") -> dict:
+    """Statistics of a numeric Series (NaN = missing)."""
+    # float32 KPIs are widened via str so -142.3 stays -142.3
+    series = widen_float32(series.to_frame()).iloc[:, 0]
+    values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = values[np.isfinite(values)]
+    if not len(valid):
+        return _result(len(values), 0, None, None, None,
+                       *(([None] * len(STAT_QUANTILES), [], []) if detail == "full" else ()), source="dataset")
+    lo, hi = valid.min(), valid.max()
+    if detail != "full":
+        return _result(len(values), len(valid), lo, hi, valid.mean(), source="dataset")
+    edges = _edges(lo, hi, bins)
+    counts, _ = np.histogram(valid, bins=edges)
+    return _result(len(values), len(valid), lo, hi, valid.mean(), np.quantile(valid, STAT_QUANTILES),
+                   edges, counts, source="dataset")
+
+
+def _ident(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_column_stats(conn, schema: str, table: str, column: str, bins: int = 32, detail: str = "full") -> dict:
+    """Exact statistics of a numeric column, computed by the database."""
+    source = f"{_ident(schema)}.{_ident(table)}"
+    col = f"{_ident(column)}::float8"
+    quantiles = ", percentile_cont(:qs) WITHIN GROUP (ORDER BY {c})".format(c=col) if detail == "full" else ""
+    params = {"qs": list(STAT_QUANTILES)} if detail == "full" else {}
+    row = conn.execute(text(
+        f"SELECT count(*), count({col}), min({col}), max({col}), avg({col}){quantiles} FROM {source}"
+    ), params).fetchone()
+    rows, count, lo, hi, mean = row[:5]
+    if detail != "full":
+        return _result(rows, count, lo, hi, mean)
+    if not count:
+        return _result(rows, 0, None, None, None, [None] * len(STAT_QUANTILES), [], [])
+
+    edges = _edges(lo, hi, bins)
+    nbins = len(edges) - 1
+    counts = np.zeros(nbins, dtype=np.int64)
+    if nbins == 1:
+        counts[0] = count
+    else:
+        # width_bucket puts max itself in bucket nbins + 1 (it belongs to the last bin), and a
+        # value a float8 rounding step below lo in bucket 0 (the first bin)
+        for bucket, n in conn.execute(text(
+            f"SELECT GREATEST(LEAST(width_bucket({col}, :lo, :hi, :n), :n), 1) AS b, count(*) "
+            f"FROM {source} WHERE {_ident(column)} IS NOT NULL GROUP BY 1"
+        ), {"lo": float(lo), "hi": float(hi), "n": nbins}):
+            counts[int(bucket) - 1] += n
+    return _result(rows, count, lo, hi, mean, row[5], edges, counts)
+
+
+def _parse_array(value) -> list:
+    """Numbers of a Postgres array literal ('{1,2.5,NaN}'), non-finite entries dropped."""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = [v.strip('"') for v in str(value).strip("{}").split(",") if v]
+    out = []
+    for v in items:
+        try:
+            f = float(v)
+        except (TypeError, ValueError):
+            continue
+        if np.isfinite(f):
+            out.append(f)
+    return out
+
+
+def pg_stats_column_stats(conn, schema: str, table: str, column: str, bins: int = 32, detail: str = "full"):
+    """
+    Approximate statistics of a numeric column from pg_stats and pg_class.reltuples, or
+    None when the table has not been analyzed (callers fall back to sql_column_stats()).
+    Each histogram bucket holds an equal share of the non-null, non-MCV rows; the
+    distribution is rebuilt from evenly spaced points per bucket plus the MCV masses.
+    """
+    row = conn.execute(text("""
+        SELECT s.null_frac, s.histogram_bounds::text, s.most_common_vals::text,
+               s.most_common_freqs, c.reltuples
+        FROM pg_stats s
+        JOIN pg_namespace n ON n.nspname = s.schemaname
+        JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = s.tablename
+        WHERE s.schemaname = :s AND s.tablename = :t AND s.attname = :c
+    """), {"s": schema, "t": table, "c": column}).fetchone()
+    if row is None or row[4] is None or row[4] < 0:
+        return None
+    null_frac, bounds, mcv, mcf, reltuples = row
+    bounds = _parse_array(bounds)
+    mcv = _parse_array(mcv)
+    mcf = [float(f) for f in (mcf or [])][:len(mcv)]
+    rows = max(float(reltuples), 0.0)
+    count = rows * (1.0 - float(null_frac or 0.0))
+
+    values, weights = [], []
+    if len(bounds) >= 2:
+        per_bucket = max(1.0 - float(null_frac or 0.0) - sum(mcf), 0.0) / (len(bounds) - 1)
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            # Midpoints of _BUCKET_POINTS equal slices of the bucket
+            values.extend(a + (b - a) * (np.arange(_BUCKET_POINTS) + 0.5) / _BUCKET_POINTS)
+            weights.extend([per_bucket / _BUCKET_POINTS] * _BUCKET_POINTS)
+    values.extend(mcv)
+    weights.extend(mcf)
+    if not values or sum(weights) <= 0:
+        empty = ([None] * len(STAT_QUANTILES), [], []) if detail == "full" else ()
+        return _result(rows, 0 if not values else count, None, None, None, *empty, source="pg_stats")
+
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    order = np.argsort(values, kind="stable")
+    values, weights = values[order], weights[order]
+    lo = min(bounds[0] if bounds else values[0], values[0])
+    hi = max(bounds[-1] if bounds else values[-1], values[-1])
+    mean = float(np.average(values, weights=weights))
+    if detail != "full":
+        return _result(rows, count, lo, hi, mean, source="pg_stats")
+
+    cum = np.cumsum(weights)
+    total = cum[-1]
+    quantiles = np.interp(np.asarray(STAT_QUANTILES) * total, cum - weights / 2, values)
+    edges = _edges(lo, hi, bins)
+    hist, _ = np.histogram(values, bins=edges, weights=weights)
+    counts = np.round(hist / total * count)
+    return _result(rows, count, lo, hi, mean, quantiles, edges, counts, source="pg_stats")
+
+
+class ColumnStatsCache:
+    """
+    Statistics results by key, at most max_entries (LRU). Entries built from database
+    tables carry the table change marker at build time and are dropped once it moves
+    (re-checked at most every marker_interval seconds) or after ttl; entries without
+    tables (immutable uploaded datasets) only expire by LRU.
+    """
+
+    def __init__(self, ttl: int, marker_interval: float, max_entries: int, marker_fn):
+        self.ttl = ttl
+        self.marker_interval = marker_interval
+        self.max_entries = max_entries
+        self.marker_fn = marker_fn
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+        now = time.time()
+        if entry is not None and entry["tables"]:
+            stale = now - entry["created_at"] > self.ttl
+            if not stale and now - entry["checked_at"] > self.marker_interval:
+                marker = self.marker_fn(entry["tables"])
+                stale = marker is None or marker != entry["marker"]
+                entry["checked_at"] = now
+            if stale:
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry["value"]
+
+    def put(self, key: tuple, value: dict, tables=None, marker=None):
+        """Stores value; a table entry whose marker could not be read is not cached."""
+        if tables and marker is None:
+            return value
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {"value": value, "tables": tables, "marker": marker,
+                                  "created_at": now, "checked_at": now}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def _drop(self, key: tuple):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "marker_interval_seconds": self.marker_interval,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
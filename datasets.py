@@ -0,0 +1,388 @@
+"""
+Registry of uploaded datasets (drive tests, grid maps), keyed by dataset id.
+
+Each upload gets its own id and belongs to the session that sent it, so concurrent
+analysts neither overwrite nor see each other's data. Every dataset is written once to DATA_DIR as a columnar file (Arrow IPC /
+Feather by default, Parquet optionally) next to a small JSON metadata file, so it
+survives restarts and is visible to every worker. Resident frames are kept under a total
+memory budget: the least recently used ones are dropped from memory and re-read from
+their file (memory-mapped, only the requested columns) on next use.
+
+Files in DATA_DIR are shared, so a worker only deletes the ones it wrote itself (when
+over DATASET_MAX_COUNT); files of any worker are deleted once older than
+DATASET_RETENTION_SECONDS. Frames are never pickled: Arrow (object columns of mixed
+types stored as text) or, without pyarrow, CSV.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import pyarrow  # Feather/Parquet engine
+except ImportError:  # optional; datasets are stored as CSV without it
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+DATASET_MEMORY_MAX_BYTES = int(os.getenv("DATASET_MEMORY_MAX_BYTES", str(1024 * 1024 * 1024)))
+DATA_DIR = os.getenv("DATA_DIR", "./data")
+DATASET_FORMAT = os.getenv("DATASET_FORMAT", "feather")  # feather | parquet
+DATASET_MAX_COUNT = int(os.getenv("DATASET_MAX_COUNT", "200"))
+# Age after which any worker deletes a stored dataset
+DATASET_RETENTION_SECONDS = int(os.getenv("DATASET_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+_EXTENSIONS = {"feather": ".arrow", "parquet": ".parquet", "csv": ".csv"}
+
+
+class Dataset:
+    """One uploaded frame plus its metadata (lat_col, lon_col, columns, filename, ...)."""
+
+    __slots__ = ("id", "kind", "session", "meta", "df", "bytes", "columns", "created", "last_used", "format")
+
+    def __init__(self, dataset_id: str, kind: str, df, meta: dict, session: str = None):
+        self.id = dataset_id
+        self.kind = kind
+        self.session = session
+        self.meta = meta
+        self.df = df
+        self.bytes = int(df.memory_usage(deep=True, index=True).sum()) if df is not None else 0
+        self.columns = [str(c) for c in df.columns] if df is not None else []
+        self.created = self.last_used = time.time()
+        self.format = None
+
+    def view(self) -> dict:
+        return {
+            "dataset_id": self.id,
+            "kind": self.kind,
+            "session": self.session,
+            "rows": self.meta.get("rows"),
+            "bytes": self.bytes,
+            "resident": self.df is not None,
+            "format": self.format,
+            "created": self.created,
+            "last_used": self.last_used,
+            **{k: v for k, v in self.meta.items() if k != "rows"},
+        }
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id, "kind": self.kind, "session": self.session, "meta": self.meta,
+            "bytes": self.bytes, "columns": self.columns, "created": self.created, "format": self.format,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Dataset":
+        ds = cls(data["id"], data["kind"], None, data.get("meta", {}), data.get("session"))
+        ds.bytes = data.get("bytes", 0)
+        ds.columns = data.get("columns", [])
+        ds.created = ds.last_used = data.get("created", time.time())
+        ds.format = data.get("format")
+        return ds
+
+
+def _mixed_as_text(df: pd.DataFrame) -> pd.DataFrame:
+    """Object columns holding more than one type, as str (missing values kept)."""
+    mixed = [c for c in df.columns if df[c].dtype == object
+             and pd.api.types.infer_dtype(df[c], skipna=True).startswith("mixed")]
+    if not mixed:
+        return df
+    df = df.copy()
+    for c in mixed:
+        df[c] = df[c].map(lambda v: v if v is None or v is pd.NA or v != v else str(v))
+    return df
+
+
+def _write_frame(df: pd.DataFrame, path_base: str, fmt: str) -> str:
+    """Writes df as fmt, or as csv when pyarrow is missing or cannot type it; returns the format used."""
+    df = df.reset_index(drop=True)
+    df.columns = [str(c) for c in df.columns]
+    if fmt != "csv":
+        path = path_base + _EXTENSIONS[fmt]
+        try:
+            _write_arrow(df, path, fmt)
+            return fmt
+        except (pyarrow.ArrowException, ValueError, TypeError) as e:
+            # Mixed-type object columns: retried as text rather than dropping to csv
+            logger.warning(f" Could not store {os.path.basename(path_base)} as {fmt} ({e}); retrying mixed columns as text")
+        text_df = _mixed_as_text(df)
+        if text_df is not df:
+            try:
+                _write_arrow(text_df, path, fmt)
+                return fmt
+            except (pyarrow.ArrowException, ValueError, TypeError) as e:
+                logger.warning(f" Could not store {os.path.basename(path_base)} as {fmt} ({e}); using csv")
+    path = path_base + _EXTENSIONS["csv"]
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return "csv"
+
+
+def _write_arrow(df: pd.DataFrame, path: str, fmt: str):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        if fmt == "parquet":
+            df.to_parquet(tmp, index=False)
+        else:
+            df.to_feather(tmp, compression="uncompressed")
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _read_frame(path_base: str, fmt: str, columns: list = None) -> pd.DataFrame:
+    path = path_base + _EXTENSIONS[fmt]
+    if fmt == "feather":
+        from pyarrow import feather
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+    df = pd.read_csv(path, usecols=columns)
+    return df[columns] if columns is not None else df
+
+
+class DatasetRegistry:
+    """
+    Thread-safe id → Dataset map backed by data_dir. add() stores a frame under a new id;
+    get() returns it with its frame loaded, or only the requested columns. The total size
+    of resident frames stays under max_bytes (the frame in use is never dropped). At most
+    max_count datasets are registered: past that the oldest are forgotten, and their files
+    deleted only if this registry wrote them. Datasets older than retention seconds are
+    deleted whoever wrote them.
+    """
+
+    def __init__(self, max_bytes: int, data_dir: str, max_count: int, fmt: str = DATASET_FORMAT,
+                 retention: int = DATASET_RETENTION_SECONDS):
+        if fmt not in ("feather", "parquet"):
+            raise ValueError("DATASET_FORMAT must be 'feather' or 'parquet'")
+        self.max_bytes = max_bytes
+        self.data_dir = data_dir
+        self.max_count = max_count
+        self.retention = retention
+        self.format = fmt if pyarrow is not None else "csv"
+        self.evictions = 0
+        self.reloads = 0
+        self.projected_reads = 0
+        self._datasets = OrderedDict()  # id → Dataset, least recently used first
+        self._latest = {}               # (kind, session) → id
+        self._owned = set()             # ids whose files this registry wrote
+        self._resident_bytes = 0
+        self._lock = threading.RLock()
+        os.makedirs(data_dir, exist_ok=True)
+        self._load_index()
+
+    def _base(self, dataset_id: str) -> str:
+        return os.path.join(self.data_dir, dataset_id)
+
+    def _load_index(self):
+        """Registers the datasets already in data_dir (not resident), oldest first."""
+        found = []
+        for name in os.listdir(self.data_dir):
+            if name.endswith(".json"):
+                ds = self._read_meta(name[:-5])
+                if ds is not None:
+                    found.append(ds)
+        for ds in sorted(found, key=lambda d: d.created):
+            self._register(ds)
+        self._expire()
+        while len(self._datasets) > self.max_count:
+            self._forget(next(iter(self._datasets)))
+        if found:
+            logger.info(f" Found {len(found)} stored datasets in {self.data_dir}")
+
+    def _read_meta(self, dataset_id: str):
+        try:
+            with open(self._base(dataset_id) + ".json", "r") as f:
+                ds = Dataset.from_json(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+        if ds.format not in _EXTENSIONS or not os.path.exists(self._base(dataset_id) + _EXTENSIONS[ds.format]):
+            return None
+        return ds
+
+    def _write_meta(self, ds: Dataset):
+        path = self._base(ds.id) + ".json"
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(ds.to_json(), f, default=str)
+        os.replace(tmp, path)
+
+    def _register(self, ds: Dataset, latest: bool = True):
+        self._datasets[ds.id] = ds
+        self._datasets.move_to_end(ds.id)
+        if latest:
+            self._latest[(ds.kind, ds.session)] = ds.id
+
+    def add(self, kind: str, df: pd.DataFrame, meta: dict = None, session: str = None) -> Dataset:
+        ds = Dataset(uuid.uuid4().hex[:16], kind, df, {"rows": len(df), **(meta or {})}, session)
+        t0 = time.perf_counter()
+        ds.format = _write_frame(df, self._base(ds.id), self.format)
+        self._write_meta(ds)
+        logger.info(f" Stored dataset {ds.id} as {ds.format} in {time.perf_counter() - t0:.2f}s")
+        with self._lock:
+            self._register(ds)
+            self._owned.add(ds.id)
+            self._resident_bytes += ds.bytes
+            self._expire()
+            while len(self._datasets) > self.max_count:
+                oldest = next(iter(self._datasets))
+                # Other workers may still serve files they wrote; those are only forgotten here
+                if oldest in self._owned:
+                    self._remove(oldest)
+                else:
+                    self._forget(oldest)
+            self._enforce_budget(keep=ds.id)
+        return ds
+
+    def update_meta(self, ds: Dataset, **meta):
+        """Adds metadata known only after registration and rewrites the metadata file."""
+        with self._lock:
+            ds.meta.update(meta)
+            self._write_meta(ds)
+
+    def latest_id(self, kind: str, session: str = None):
+        """The newest upload of kind by session (None = uploads sent without a session)."""
+        with self._lock:
+            return self._latest.get((kind, session))
+
+    def lookup(self, dataset_id: str, kind: str = None):
+        """
+        The Dataset (metadata only, nothing is read) or None when the id is unknown or of
+        another kind. Ids stored by other workers are picked up from data_dir.
+        """
+        with self._lock:
+            ds = self._datasets.get(dataset_id)
+            if ds is None and dataset_id and dataset_id.isalnum():
+                ds = self._read_meta(dataset_id)
+                if ds is not None and self._expired(ds):
+                    ds = None
+                if ds is not None:
+                    self._register(ds, latest=False)
+            if ds is None or (kind is not None and ds.kind != kind):
+                return None
+            return ds
+
+    def get(self, dataset_id: str, kind: str = None, columns: list = None):
+        """
+        (dataset, frame), or (None, None) when lookup() finds nothing or its file is gone
+        (removed by another request or worker). With columns, a dataset that is not
+        resident is read for just those columns and stays on disk. Callers use the
+        returned frame, which stays valid even if the dataset is evicted.
+        """
+        with self._lock:
+            ds = self.lookup(dataset_id, kind)
+            if ds is None:
+                return None, None
+            ds.last_used = time.time()
+            self._datasets.move_to_end(dataset_id)
+            if ds.df is not None:
+                return ds, (ds.df if columns is None else ds.df[list(columns)])
+            if columns is not None:
+                self.projected_reads += 1
+
+        if columns is not None:
+            # Outside the lock: a memory-mapped read of a few columns
+            try:
+                return ds, _read_frame(self._base(dataset_id), ds.format, list(columns))
+            except FileNotFoundError:
+                return self._vanished(dataset_id)
+
+        with self._lock:
+            if ds.df is None:
+                t0 = time.perf_counter()
+                try:
+                    ds.df = _read_frame(self._base(dataset_id), ds.format)
+                except FileNotFoundError:
+                    return self._vanished(dataset_id)
+                ds.bytes = int(ds.df.memory_usage(deep=True, index=True).sum())
+                self._resident_bytes += ds.bytes
+                self.reloads += 1
+                logger.info(f" Reloaded dataset {dataset_id} ({ds.format}) in {time.perf_counter() - t0:.2f}s")
+            df = ds.df
+            self._enforce_budget(keep=dataset_id)
+            return ds, df
+
+    def remove(self, dataset_id: str) -> bool:
+        with self._lock:
+            if self.lookup(dataset_id) is None:
+                return False
+            self._remove(dataset_id)
+            return True
+
+    def _vanished(self, dataset_id: str):
+        logger.warning(f" Dataset {dataset_id} file is gone; forgetting it")
+        with self._lock:
+            if dataset_id in self._datasets:
+                self._forget(dataset_id)
+        return None, None
+
+    def _expired(self, ds: Dataset) -> bool:
+        return self.retention > 0 and time.time() - ds.created > self.retention
+
+    def _expire(self):
+        for dataset_id in [i for i, ds in self._datasets.items() if self._expired(ds)]:
+            logger.info(f" Dataset {dataset_id} is past retention; deleting it")
+            self._remove(dataset_id)
+
+    def _forget(self, dataset_id: str):
+        """Drops a dataset from this registry only; its files stay for other workers."""
+        ds = self._datasets.pop(dataset_id)
+        self._owned.discard(dataset_id)
+        if ds.df is not None:
+            self._resident_bytes -= ds.bytes
+            ds.df = None
+        for key in [k for k, v in self._latest.items() if v == dataset_id]:
+            del self._latest[key]
+
+    def _remove(self, dataset_id: str):
+        self._forget(dataset_id)
+        # The data and metadata files plus derived ones (e.g. <id>.pyramid.npz)
+        for name in os.listdir(self.data_dir):
+            if name.startswith(f"{dataset_id}."):
+                try:
+                    os.remove(os.path.join(self.data_dir, name))
+                except OSError:
+                    pass
+
+    def _enforce_budget(self, keep: str):
+        # Every frame is already on disk, so evicting only drops the in-memory copy
+        for dataset_id, ds in list(self._datasets.items()):
+            if self._resident_bytes <= self.max_bytes:
+                break
+            if dataset_id == keep or ds.df is None:
+                continue
+            ds.df = None
+            self._resident_bytes -= ds.bytes
+            self.evictions += 1
+            logger.info(f" Evicted dataset {ds.id} from memory ({ds.bytes / 1024 / 1024:.1f} MB)")
+
+    def list(self, kind: str = None, session: str = None) -> list:
+        """The uploads of one session (None = uploads sent without a session), newest use first."""
+        with self._lock:
+            return [
+                ds.view() for ds in reversed(self._datasets.values())
+                if (kind is None or ds.kind == kind) and ds.session == session
+            ]
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "datasets": len(self._datasets),
+                "resident": sum(1 for ds in self._datasets.values() if ds.df is not None),
+                "resident_bytes": self._resident_bytes,
+                "max_bytes": self.max_bytes,
+                "owned": len(self._owned),
+                "retention_seconds": self.retention,
+                "data_dir": self.data_dir,
+                "format": self.format,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "projected_reads": self.projected_reads,
+            }
@@ -0,0 +1,297 @@
+"""
+Distinct-value index per (table, column) for filter dropdowns and typeahead.
+
+One GROUP BY scan gives every distinct value with its row count. Values are kept sorted
+case-insensitively in one UTF-8 buffer with int64 offsets (the Arrow string layout: no
+per-value objects, no fixed-width padding) plus an int64 count array, so a prefix is two
+binary searches and a page is a slice, with the full cardinality known. Values longer than
+max_chars are left out (and counted), so one huge text value cannot blow up an index.
+The scan is streamed and stops as soon as the values outgrow the byte budget, so a
+high-cardinality column is refused without ever being held in full. Indexes are built on
+a background worker and rebuilt when the table's change marker moves; the previous index
+keeps answering while its replacement builds.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+_MAX_CHAR = "\U0010ffff"
+# Bytes per value besides its text: one int64 offset and one int64 count
+_VALUE_OVERHEAD = 16
+
+
+class IndexTooLarge(Exception):
+    """A column's distinct values would not fit in the byte budget."""
+
+
+class DistinctIndex:
+    """Distinct values of one column sorted case-insensitively, with their row counts."""
+
+    __slots__ = ("data", "offsets", "counts", "skipped_rows", "marker", "built_at", "checked_at", "seconds")
+
+    def __init__(self, values, counts, skipped_rows: int = 0, marker=None, seconds: float = 0.0):
+        order = sorted(range(len(values)), key=lambda i: (values[i].lower(), values[i]))
+        encoded = [values[i].encode("utf-8") for i in order]
+        self.data = b"".join(encoded)
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=self.offsets[1:])
+        self.counts = np.asarray(counts, dtype=np.int64)[order] if len(order) else np.zeros(0, dtype=np.int64)
+        self.skipped_rows = skipped_rows
+        self.marker = marker
+        self.built_at = self.checked_at = time.time()
+        self.seconds = seconds
+
+    def __len__(self):
+        return len(self.counts)
+
+    def value(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    @property
+    def rows(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.nbytes + self.counts.nbytes
+
+    def _lower_bound(self, folded: str) -> int:
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.value(mid).lower() < folded:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def prefix_range(self, prefix: str = None):
+        """(start, stop) of the values starting with prefix (case-insensitive)."""
+        if not prefix:
+            return 0, len(self)
+        p = prefix.lower()
+        return self._lower_bound(p), self._lower_bound(p + _MAX_CHAR)
+
+    def page(self, prefix: str = None, offset: int = 0, limit: int = 100) -> dict:
+        start, stop = self.prefix_range(prefix)
+        lo = min(start + offset, stop)
+        hi = min(lo + limit, stop)
+        return {
+            "values": [self.value(i) for i in range(lo, hi)],
+            "counts": self.counts[lo:hi].tolist(),
+            "total": stop - start,
+            "cardinality": len(self),
+            "rows": self.rows,
+        }
+
+
+def _ident(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_distinct_index(conn, schema: str, table: str, column: str, max_chars: int = 256,
+                       max_bytes: int = None, batch_rows: int = 10000) -> DistinctIndex:
+    """
+    Every non-blank value of column (as text, trimmed, so ' A' and 'A' are one value)
+    with its row count, in one GROUP BY scan. Values longer than max_chars are not
+    transferred; their rows are counted in skipped_rows. With max_bytes the rows are
+    streamed batch_rows at a time (the scan is also LIMITed to the most values that could
+    fit) and IndexTooLarge is raised once the index would need more than max_bytes.
+    """
+    t0 = time.perf_counter()
+    col = f"TRIM({_ident(column)}::text)"
+    sql = (f"SELECT CASE WHEN length({col}) <= :n THEN {col} END AS v, count(*) "
+           f"FROM {_ident(schema)}.{_ident(table)} WHERE {_ident(column)} IS NOT NULL AND {col} <> '' GROUP BY 1")
+    params = {"n": max_chars}
+    if max_bytes is not None:
+        sql += " LIMIT :cap"
+        params["cap"] = max_bytes // _VALUE_OVERHEAD + 1
+    result = conn.execution_options(stream_results=True).execute(text(sql), params)
+    values, counts = [], []
+    skipped = nbytes = 0
+    for rows in result.partitions(batch_rows):
+        for v, n in rows:
+            if v is None:
+                skipped += n
+                continue
+            values.append(v)
+            counts.append(n)
+            nbytes += len(v.encode("utf-8")) + _VALUE_OVERHEAD
+        if max_bytes is not None and nbytes > max_bytes:
+            result.close()
+            raise IndexTooLarge(f"{schema}.{table}.{column} needs over {max_bytes / 1024 / 1024:.1f} MB "
+                                f"(stopped after {len(values)} values)")
+    return DistinctIndex(values, counts, skipped_rows=skipped, seconds=time.perf_counter() - t0)
+
+
+class DistinctIndexStore:
+    """
+    Built indexes by key, evicted LRU past max_bytes. get() returns the current index
+    right away (rebuilding it in the background once the table's change marker moves,
+    checked at most every marker_interval seconds); a key without an index is built on
+    the worker and waited for at most wait seconds. An index larger than max_bytes on its
+    own (or whose build raises IndexTooLarge) is dropped, and not rebuilt until its table
+    changes. When no marker can be read (views, foreign tables), an index is rebuilt once
+    older than untracked_ttl seconds. A key whose build failed is retried at most every
+    marker_interval seconds; until then get() answers "failed".
+    """
+
+    def __init__(self, max_bytes: int, marker_interval: float, marker_fn, workers: int = 1,
+                 untracked_ttl: float = 300.0):
+        self.max_bytes = max_bytes
+        self.marker_interval = marker_interval
+        self.untracked_ttl = untracked_ttl
+        self.marker_fn = marker_fn
+        self.builds = 0
+        self.rebuilds = 0
+        self._indexes = OrderedDict()
+        self._futures = {}
+        self._refused = {}  # key → {"marker", "checked_at", "refused_at"} of indexes over max_bytes
+        self._failed = {}  # key → time of its last failed build
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="distinct-index")
+
+    def get(self, key: tuple, build_fn, tables, wait: float = 0.0):
+        """
+        (index or None, state): state is "ready", "stale" (served while a rebuild runs),
+        "building" (no index within wait seconds), "too_large" (over max_bytes) or
+        "failed" (the first build raised; callers answer without an index).
+        """
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+            refused = self._refused.get(key)
+        if refused is not None:
+            now = time.time()
+            if now - refused["checked_at"] <= self.marker_interval:
+                return None, "too_large"
+            marker = self.marker_fn(tables)
+            refused["checked_at"] = now
+            if self._unchanged(marker, refused["marker"], refused["refused_at"], now):
+                return None, "too_large"
+            with self._lock:
+                self._refused.pop(key, None)
+        if index is not None:
+            if key in self._futures:
+                return index, "stale"
+            now = time.time()
+            if now - index.checked_at <= self.marker_interval:
+                return index, "ready"
+            marker = self.marker_fn(tables)
+            index.checked_at = now
+            if self._unchanged(marker, index.marker, index.built_at, now):
+                return index, "ready"
+            logger.info(f" Distinct index {key} is stale (table changed) → rebuilding")
+            self._schedule(key, build_fn, tables)
+            return index, "stale"
+
+        failed_at = self._failed.get(key)
+        if failed_at is not None and time.time() - failed_at <= self.marker_interval:
+            return None, "failed"
+        future = self._schedule(key, build_fn, tables)
+        try:
+            index = future.result(timeout=wait)
+        except FutureTimeout:
+            return None, "building"
+        except Exception:
+            return None, "failed"
+        return (index, "ready") if index is not None else (None, "too_large")
+
+    def _unchanged(self, marker, built_marker, built_at: float, now: float) -> bool:
+        if marker is None or built_marker is None:
+            return now - built_at <= self.untracked_ttl
+        return marker == built_marker
+
+    def _schedule(self, key: tuple, build_fn, tables):
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._executor.submit(self._build, key, build_fn, tables)
+                self._futures[key] = future
+            return future
+
+    def _refuse(self, key: tuple, marker):
+        now = time.time()
+        self._refused[key] = {"marker": marker, "checked_at": now, "refused_at": now}
+        old = self._indexes.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+
+    def _build(self, key: tuple, build_fn, tables):
+        try:
+            # Marker first, so writes during the scan make the new index stale
+            marker = self.marker_fn(tables)
+            try:
+                index = build_fn()
+            except IndexTooLarge as e:
+                with self._lock:
+                    self._refuse(key, marker)
+                    self._failed.pop(key, None)
+                logger.warning(f" Distinct index {key} not kept: {e}")
+                return None
+            index.marker = marker
+            with self._lock:
+                self._failed.pop(key, None)
+                old = self._indexes.pop(key, None)
+                if old is not None:
+                    self._bytes -= old.nbytes
+                    self.rebuilds += 1
+                if index.nbytes > self.max_bytes:
+                    self._refuse(key, marker)
+                    logger.warning(f" Distinct index {key} needs {index.nbytes / 1024 / 1024:.1f} MB, over "
+                                   f"the {self.max_bytes / 1024 / 1024:.1f} MB budget; not kept")
+                    return None
+                self.builds += 1
+                self._indexes[key] = index
+                self._bytes += index.nbytes
+                # The new index fits on its own, so this only drops older ones
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._indexes.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+            logger.info(f" Built distinct index {key}: {len(index)} values, "
+                        f"{index.nbytes / 1024 / 1024:.1f} MB in {index.seconds:.2f}s")
+            return index
+        except Exception as e:
+            with self._lock:
+                self._failed[key] = time.time()
+            logger.error(f" Distinct index build failed for {key}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._refused.clear()
+            self._failed.clear()
+            self._bytes = 0
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "indexes": [
+                    {"key": list(key), "values": len(index), "rows": index.rows, "bytes": index.nbytes,
+                     "skipped_rows": index.skipped_rows, "built_at": index.built_at,
+                     "build_seconds": round(index.seconds, 3)}
+                    for key, index in reversed(self._indexes.items())
+                ],
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "marker_interval_seconds": self.marker_interval,
+                "untracked_ttl_seconds": self.untracked_ttl,
+                "building": [list(key) for key in self._futures],
+                "too_large": [list(key) for key in self._refused],
+                "failed": [list(key) for key in self._failed],
+                "builds": self.builds,
+                "rebuilds": self.rebuilds,
+            }
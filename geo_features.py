@@ -0,0 +1,118 @@
+"""
+Columnar GeoJSON helpers for /query.
+
+Builds Point features straight from a DataFrame: coordinates are validated with
+NumPy masks and bands are normalized once per distinct value instead of once per row.
+"""
+import numpy as np
+import pandas as pd
+
+
+def map_distinct(series: pd.Series, fn) -> pd.Series:
+    """Applies fn once per distinct non-null value of series; nulls map to None."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    mapped = np.empty(len(uniques) + 1, dtype=object)
+    mapped[:-1] = [fn(v) for v in uniques]
+    mapped[-1] = None
+    return pd.Series(mapped[codes], index=series.index, dtype=object)
+
+
+def widen_float32(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    float16/float32 columns as float64 holding each value's shortest decimal form, so
+    compact frames serialize as 1.1 rather than 1.100000023841858.
+    """
+    narrow = [c for c in df.columns if df[c].dtype in (np.float16, np.float32)]
+    if not narrow:
+        return df
+    df = df.copy()
+    for col in narrow:
+        df[col] = df[col].astype(str).astype(np.float64)
+    return df
+
+
+def _truthy(series: pd.Series) -> pd.Series:
+    return series.notna() & series.astype(bool)
+
+
+def _first_truthy(frame: pd.DataFrame, keys) -> pd.Series:
+    """Column-wise equivalent of `row.get(k1) or row.get(k2) or ...`."""
+    chosen = None
+    for key in keys:
+        if key not in frame.columns:
+            continue
+        col = frame[key].astype(object)
+        col = col.where(col.notna(), None)
+        chosen = col if chosen is None else chosen.where(_truthy(chosen), col)
+    if chosen is None:
+        chosen = pd.Series([None] * len(frame), index=frame.index, dtype=object)
+    return chosen
+
+
+def prepare_points(df: pd.DataFrame, lon_col: str, lat_col: str,
+                   band_keys=("band", "cellname"), band_normalizer=None):
+    """
+    Drops rows whose lon/lat are not finite numbers and normalizes the band column.
+
+    Returns (frame, lon, lat, bands): the kept rows as an object frame with NaN → None,
+    float arrays of coordinates, and the set of normalized bands seen. When
+    band_normalizer (Series → Series) returns a value for a row it replaces "band";
+    otherwise the row keeps its original band.
+    """
+    lon = pd.to_numeric(df[lon_col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    lat = pd.to_numeric(df[lat_col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    mask = np.isfinite(lon) & np.isfinite(lat)
+
+    kept = widen_float32(df[mask])
+    frame = kept.astype(object).where(kept.notna(), None)
+
+    bands = set()
+    if band_normalizer is not None and len(frame):
+        norm = band_normalizer(_first_truthy(frame, band_keys))
+        has_band = _truthy(norm)
+        if has_band.any():
+            if "band" in frame.columns:
+                frame["band"] = norm.where(has_band, frame["band"])
+            else:
+                frame["band"] = norm.where(has_band, None)
+            bands = set(norm[has_band])
+
+    return frame, lon[mask], lat[mask], bands
+
+
+def frame_to_features(frame: pd.DataFrame, lon: np.ndarray, lat: np.ndarray, skip_none: bool = False) -> list:
+    """Point features for a frame returned by prepare_points(); skip_none leaves out None properties."""
+    columns = list(frame.columns)
+    rows = zip(*(frame.iloc[:, i].tolist() for i in range(len(columns)))) if columns else ([] for _ in lon)
+    if skip_none:
+        props = ({k: v for k, v in zip(columns, row) if v is not None} for row in rows)
+    else:
+        props = (dict(zip(columns, row)) for row in rows)
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [x, y]},
+            "properties": p,
+        }
+        for x, y, p in zip(lon.tolist(), lat.tolist(), props)
+    ]
+
+
+def frame_to_columns(frame: pd.DataFrame, lon: np.ndarray, lat: np.ndarray) -> dict:
+    """
+    Columnar equivalent of frame_to_features(): one shared "columns" header, one value
+    array per column (same order) and the coordinates as two parallel arrays.
+    """
+    return {
+        "columns": [str(c) for c in frame.columns],
+        "coordinates": {"lon": lon.tolist(), "lat": lat.tolist()},
+        "values": [frame.iloc[:, i].tolist() for i in range(frame.shape[1])],
+        "count": len(frame),
+    }
+
+
+def build_point_features(df: pd.DataFrame, lon_col: str, lat_col: str,
+                         band_keys=("band", "cellname"), band_normalizer=None):
+    """Returns (features, bands) for df — the columnar replacement for the iterrows() loops."""
+    frame, lon, lat, bands = prepare_points(df, lon_col, lat_col, band_keys, band_normalizer)
+    return frame_to_features(frame, lon, lat), bands
@@ -0,0 +1,100 @@
+"""
+Compact in-memory storage for uploaded drive-test logs.
+
+Uploads are parsed in chunks; every chunk is shrunk on arrival (float KPIs → float32 when
+that loses nothing, integers → smallest integer type, repeated strings → categoricals) so
+the peak memory is about one raw chunk plus the compact rows read so far.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from geo_features import widen_float32
+
+DRIVE_TEST_CHUNK_ROWS = int(os.getenv("DRIVE_TEST_CHUNK_ROWS", "100000"))
+# A string column stays categorical while distinct values ≤ this share of its rows
+DRIVE_TEST_CATEGORY_RATIO = float(os.getenv("DRIVE_TEST_CATEGORY_RATIO", "0.5"))
+
+
+# float32 reproduces any decimal of up to FLT_DIG significant digits (via widen_float32)
+_FLOAT32_DIGITS = np.finfo(np.float32).precision
+
+
+def fits_float32(values) -> bool:
+    """
+    True when float32 keeps every value: exactly, or as a decimal of at most FLT_DIG
+    significant digits. ID-like floats (an ECI of 268435298 with blanks) are not kept.
+    """
+    v = np.asarray(values, dtype=np.float64)
+    v = v[np.isfinite(v) & (v != 0)]
+    if not len(v):
+        return True
+    if np.abs(v).max() > np.finfo(np.float32).max or np.abs(v).min() < np.finfo(np.float32).tiny:
+        return False
+    if np.array_equal(v.astype(np.float32).astype(np.float64), v):
+        return True
+    scale = 10.0 ** (np.floor(np.log10(np.abs(v))) - (_FLOAT32_DIGITS - 1))
+    return bool(np.allclose(np.round(v / scale) * scale, v, rtol=1e-12, atol=0.0))
+
+
+def compact_dtypes(df: pd.DataFrame, keep=()) -> pd.DataFrame:
+    """
+    Downcasts one chunk in place: floats → float32 where fits_float32(), integers →
+    smallest integer type, object columns → category. Columns in keep (e.g. lat/lon)
+    are left untouched.
+    """
+    for col in df.columns:
+        if col in keep:
+            continue
+        dtype = df[col].dtype
+        if pd.api.types.is_float_dtype(dtype):
+            if fits_float32(df[col].to_numpy()):
+                df[col] = df[col].astype(np.float32)
+        elif pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif dtype == object:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def concat_compact(chunks: list) -> pd.DataFrame:
+    """
+    Concatenates compacted chunks. Categorical columns share one category set across
+    chunks and fall back to object when the column turns out to be mostly distinct; a
+    float column kept as float64 in some chunk is float64 throughout, with float32 chunks
+    widened via their decimal form (not their binary value).
+    """
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        df = chunks[0]
+    else:
+        for col in chunks[0].columns:
+            parts = [c[col] for c in chunks if col in c.columns]
+            if any(p.dtype == np.float64 for p in parts) and any(p.dtype == np.float32 for p in parts):
+                for c in chunks:
+                    if col in c.columns and c[col].dtype == np.float32:
+                        c[col] = widen_float32(c[[col]])[col]
+            if parts and all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+                categories = union_categoricals([p.array for p in parts], ignore_order=True).categories
+                for c in chunks:
+                    c[col] = c[col].cat.set_categories(categories)
+        df = pd.concat(chunks, ignore_index=True)
+
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            if len(df[col].cat.categories) > DRIVE_TEST_CATEGORY_RATIO * max(len(df), 1):
+                df[col] = df[col].astype(object)
+    return df
+
+
+def memory_report(df: pd.DataFrame) -> dict:
+    usage = df.memory_usage(deep=True, index=True)
+    by_dtype = {}
+    for col in df.columns:
+        key = str(df[col].dtype)
+        by_dtype[key] = by_dtype.get(key, 0) + int(usage[col])
+    total = int(usage.sum())
+    return {"bytes": total, "mb": round(total / 1024 / 1024, 2), "by_dtype": by_dtype}
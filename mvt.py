@@ -0,0 +1,257 @@
+"""
+Mapbox Vector Tile (MVT 2.1) encoding for point layers, plus a size-bounded disk cache.
+
+The protobuf messages (Tile → Layer → Feature/Value) are written by hand, so no
+protobuf or mapbox-vector-tile dependency is needed for the handful of fields used here.
+"""
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MVT_EXTENT = 4096
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+_POINT = 1
+_MOVE_TO_ONE = (1 & 0x7) | (1 << 3)
+
+
+# === Tile math (Web Mercator, XYZ scheme) ===
+def tile_bounds(z: int, x: int, y: int, buffer: float = 0.0):
+    """
+    (min_lon, min_lat, max_lon, max_lat) of tile z/x/y. buffer is a fraction of the
+    tile size added on every side so points near the edge are not clipped.
+    """
+    n = 2 ** z
+
+    def lon(tx):
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty):
+        ty = min(max(ty, 0.0), float(n))
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return (
+        max(lon(x - buffer), -180.0),
+        lat(y + 1 + buffer),
+        min(lon(x + 1 + buffer), 180.0),
+        lat(y - buffer),
+    )
+
+
+def project_to_tile(lon: np.ndarray, lat: np.ndarray, z: int, x: int, y: int, extent: int = MVT_EXTENT):
+    """Integer tile-space coordinates (origin top-left) for WGS84 lon/lat arrays."""
+    n = 2 ** z
+    lat = np.clip(lat, -85.0511287798, 85.0511287798)
+    mx = (lon + 180.0) / 360.0 * n
+    rad = np.radians(lat)
+    my = (1.0 - np.log(np.tan(rad) + 1.0 / np.cos(rad)) / math.pi) / 2.0 * n
+    px = np.round((mx - x) * extent).astype(np.int64)
+    py = np.round((my - y) * extent).astype(np.int64)
+    return px, py
+
+
+# === Protobuf wire format ===
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed(field: int, values) -> bytes:
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _value(value) -> bytes:
+    """Layer Value message; None for types MVT cannot carry."""
+    if isinstance(value, (bool, np.bool_)):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, (int, np.integer)):
+        value = int(value)
+        if -(2 ** 63) <= value < 2 ** 63:
+            return _key(6, 0) + _varint(_zigzag(value) & 0xFFFFFFFFFFFFFFFF)
+        value = float(value)
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, (float, np.floating)):
+        if not math.isfinite(value):
+            return None
+        return _key(3, 1) + struct.pack("<d", float(value))
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def encode_point_layer(name: str, columns: list, values: list, px: np.ndarray, py: np.ndarray,
+                       extent: int = MVT_EXTENT) -> bytes:
+    """
+    One Layer message with a Point feature per row. columns/values are the column-major
+    attributes (as from geo_features.frame_to_columns); None/NaN attributes are omitted.
+    """
+    keys, key_index = [], {}
+    vals, val_index = [], {}
+    features = []
+
+    for row, (x, y) in enumerate(zip(px.tolist(), py.tolist())):
+        tags = []
+        for col_i, col in enumerate(columns):
+            v = values[col_i][row]
+            if v is None:
+                continue
+            encoded = _value(v)
+            if encoded is None:
+                continue
+            ki = key_index.get(col)
+            if ki is None:
+                ki = key_index[col] = len(keys)
+                keys.append(col)
+            vi = val_index.get(encoded)
+            if vi is None:
+                vi = val_index[encoded] = len(vals)
+                vals.append(encoded)
+            tags.extend((ki, vi))
+
+        feature = _key(1, 0) + _varint(row + 1)
+        if tags:
+            feature += _packed(2, tags)
+        feature += _key(3, 0) + _varint(_POINT)
+        feature += _packed(4, (_MOVE_TO_ONE, _zigzag(x), _zigzag(y)))
+        features.append(_bytes_field(2, feature))
+
+    layer = bytearray()
+    layer += _key(15, 0) + _varint(2)
+    layer += _bytes_field(1, name.encode("utf-8"))
+    for feature in features:
+        layer += feature
+    for k in keys:
+        layer += _bytes_field(3, str(k).encode("utf-8"))
+    for v in vals:
+        layer += _bytes_field(4, v)
+    layer += _key(5, 0) + _varint(extent)
+    return bytes(layer)
+
+
+def encode_point_tile(layer_name: str, columns: list, values: list, lon: np.ndarray, lat: np.ndarray,
+                      z: int, x: int, y: int, extent: int = MVT_EXTENT) -> bytes:
+    """A complete tile (one point layer) for the given lon/lat arrays and attributes."""
+    px, py = project_to_tile(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float), z, x, y, extent)
+    return _bytes_field(3, encode_point_layer(layer_name, columns, values, px, py, extent))
+
+
+# === Disk cache ===
+class TileDiskCache:
+    """
+    Stores encoded tiles as files under directory, evicting least recently used tiles
+    once the total size passes max_bytes. Tiles older than ttl seconds are regenerated.
+    The LRU index lives in memory and is rebuilt from the directory on startup.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._index = OrderedDict()  # file name → (size, created)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".mvt"):
+                st = os.stat(os.path.join(directory, name))
+                entries.append((st.st_mtime, name, st.st_size))
+        for created, name, size in sorted(entries):
+            self._index[name] = (size, created)
+            self._bytes += size
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest() + ".mvt"
+
+    def get(self, key: str):
+        name = self._name(key)
+        with self._lock:
+            entry = self._index.get(name)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._index.move_to_end(name)
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self._drop(name)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        name = self._name(key)
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._drop(name, unlink=False)
+            self._index[name] = (len(data), time.time())
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._index) > 1:
+                self._drop(next(iter(self._index)))
+
+    def clear(self):
+        with self._lock:
+            for name in list(self._index):
+                self._drop(name)
+
+    def _drop(self, name: str, unlink: bool = True):
+        entry = self._index.pop(name, None)
+        if entry is None:
+            return
+        self._bytes -= entry[0]
+        if unlink:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "tiles": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,282 @@
+"""
+Multi-resolution KPI grid pyramid on a Web Mercator grid.
+
+The finest level bins points into cell_px × cell_px screen cells at max_zoom; every
+coarser level merges 2×2 cells of the level below, so only the finest level touches the
+points. Per cell and KPI it keeps n/sum/min/max (exact at every level) and a histogram
+over fixed per-KPI bin edges, which rolls up by addition and gives approximate
+median/p10/p90. Histograms are sparse: per cell only its non-empty (bin, count) pairs,
+located through a per-cell offset array (CSR layout), since a cell at a fine zoom holds a
+few points and a dense cells × bins array would be mostly zeros. A pyramid is
+saved to and loaded from a single compressed .npz file.
+"""
+import math
+import os
+
+import numpy as np
+
+from binning import GRID_STATS
+from clustering import TILE_PX, mercator_unit
+
+_QUANTILES = {"median": 0.5, "p10": 0.1, "p90": 0.9}
+
+
+_STAT_PARTS = ("n", "sum", "min", "max", "hptr", "hbin", "hcount")
+
+
+def sparse_hist(cell, b, bins: int, ncells: int, weights=None):
+    """
+    Histogram of the (cell, b) pairs as (hptr, hbin, hcount): the non-empty bins of cell
+    i and their counts are hbin/hcount[hptr[i]:hptr[i + 1]], in bin order.
+    """
+    keys, inverse = np.unique(cell.astype(np.int64) * bins + b, return_inverse=True)
+    counts = np.bincount(inverse, weights=weights, minlength=len(keys)) if len(keys) else np.zeros(0)
+    hptr = np.searchsorted(keys // bins, np.arange(ncells + 1)).astype(np.int64)
+    return hptr, (keys % bins).astype(np.uint8 if bins <= 256 else np.uint16), counts.astype(np.uint32)
+
+
+def hist_cells(hptr: np.ndarray) -> np.ndarray:
+    """Cell index of every histogram entry."""
+    return np.repeat(np.arange(len(hptr) - 1), np.diff(hptr))
+
+
+class PyramidLevel:
+    """Cells of one zoom: cell ids, point counts and per-KPI (n, sum, min, max, sparse histogram)."""
+
+    __slots__ = ("cx", "cy", "count", "stats")
+
+    def __init__(self, cx, cy, count, stats):
+        self.cx, self.cy = cx, cy
+        self.count = count
+        self.stats = stats  # kpi → (n, sum, min, max, hcell, hbin, hcount)
+
+    def __len__(self):
+        return len(self.count)
+
+    @property
+    def nbytes(self) -> int:
+        return self.cx.nbytes + self.cy.nbytes + self.count.nbytes + sum(
+            a.nbytes for parts in self.stats.values() for a in parts)
+
+    def merge(self, bins: int) -> "PyramidLevel":
+        """The next coarser level: 2×2 blocks of cells become one cell."""
+        cx, cy = self.cx >> 1, self.cy >> 1
+        if not len(cx):
+            return PyramidLevel(cx, cy, self.count, self.stats)
+        key = (cx << 32) | cy
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+        first = np.r_[True, key[1:] != key[:-1]]
+        starts = np.flatnonzero(first)
+        parent = np.empty(len(key), dtype=np.int64)
+        parent[order] = np.cumsum(first) - 1  # child cell → index of its merged cell
+
+        def add(a):
+            # reduceat widens unsigned counts to 64 bits; keep the input dtype
+            return np.add.reduceat(a[order], starts, axis=0).astype(a.dtype, copy=False)
+
+        stats = {}
+        for name, (n, total, lo, hi, hptr, hbin, hcount) in self.stats.items():
+            stats[name] = (add(n), add(total), np.fmin.reduceat(lo[order], starts), np.fmax.reduceat(hi[order], starts),
+                           *sparse_hist(parent[hist_cells(hptr)], hbin, bins, len(starts), weights=hcount))
+        return PyramidLevel(cx[order][starts], cy[order][starts], add(self.count), stats)
+
+
+def _hist_quantile(hptr, hbin, hcount, edges, lo, hi, n, q):
+    """Approximate per-cell quantile from a sparse histogram, clamped to the cell's [min, max]."""
+    out = np.full(len(n), np.nan)
+    cells = np.flatnonzero(n > 0)
+    if not len(cells):
+        return out
+    # Entries are stored cell after cell, so one running total serves every cell's segment
+    cum = np.cumsum(hcount, dtype=np.float64)
+    first = hptr[cells]
+    last = hptr[cells + 1] - 1
+    base = np.where(first > 0, cum[np.maximum(first - 1, 0)], 0.0)
+    target = q * n[cells]
+    i = np.clip(np.searchsorted(cum, base + target, side="left"), first, last)
+    b = hbin[i].astype(np.int64)
+    in_bin = hcount[i].astype(np.float64)
+    below = cum[i] - in_bin - base
+    frac = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1), 0.5)
+    value = edges[b] + frac * (edges[b + 1] - edges[b])
+    out[cells] = np.clip(value, lo[cells], hi[cells])
+    return out
+
+
+class GridPyramid:
+    """
+    KPI grid pyramid for a point dataset. values maps KPI name → numeric array (NaN =
+    missing); bins is the histogram resolution used for the approximate quantiles.
+    """
+
+    def __init__(self, lon=None, lat=None, values: dict = None, min_zoom: int = 0, max_zoom: int = 16,
+                 cell_px: int = 32, bins: int = 32):
+        if cell_px not in (1, 2, 4, 8, 16, 32, 64, 128, 256):
+            raise ValueError("cell_px must be a power of two up to 256")
+        self.min_zoom, self.max_zoom, self.cell_px, self.bins = min_zoom, max_zoom, cell_px, bins
+        self.cell_bits = int(math.log2(TILE_PX // cell_px))
+        self.levels = {}
+        self.edges = {}
+        self.point_count = 0
+        if lon is not None:
+            self._build(lon, lat, values or {})
+
+    @property
+    def kpis(self) -> list:
+        return list(self.edges)
+
+    def _build(self, lon, lat, values: dict):
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        keep = np.isfinite(lon) & np.isfinite(lat)
+        lon, lat = lon[keep], lat[keep]
+        self.point_count = len(lon)
+
+        mx, my = mercator_unit(lon, lat)
+        scale = float(2 ** (self.max_zoom + self.cell_bits))
+        key = ((mx * scale).astype(np.int64) << 32) | (my * scale).astype(np.int64)
+        cells, inverse, count = np.unique(key, return_inverse=True, return_counts=True)
+        ncells = len(cells)
+
+        stats = {}
+        for name, v in values.items():
+            v = np.asarray(v, dtype=float)[keep]
+            valid = np.isfinite(v)
+            vv, cell_of = v[valid], inverse[valid]
+            if len(vv):
+                lo_edge, hi_edge = float(vv.min()), float(vv.max())
+            else:
+                lo_edge, hi_edge = 0.0, 0.0
+            if hi_edge <= lo_edge:
+                hi_edge = lo_edge + 1.0
+            edges = np.linspace(lo_edge, hi_edge, self.bins + 1)
+            b = np.clip(np.searchsorted(edges, vv, side="right") - 1, 0, self.bins - 1)
+            lo = np.full(ncells, np.nan)
+            hi = np.full(ncells, np.nan)
+            if len(vv):
+                order = np.argsort(cell_of, kind="stable")
+                sorted_cells = cell_of[order]
+                starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+                lo[sorted_cells[starts]] = np.minimum.reduceat(vv[order], starts)
+                hi[sorted_cells[starts]] = np.maximum.reduceat(vv[order], starts)
+            stats[name] = (
+                np.bincount(cell_of, minlength=ncells).astype(np.uint32),
+                np.bincount(cell_of, weights=vv, minlength=ncells),
+                lo, hi, *sparse_hist(cell_of, b, self.bins, ncells),
+            )
+            self.edges[name] = edges
+
+        level = PyramidLevel(cells >> 32, cells & 0xFFFFFFFF, count.astype(np.uint32), stats)
+        self.levels[self.max_zoom] = level
+        for z in range(self.max_zoom - 1, self.min_zoom - 1, -1):
+            level = level.merge(self.bins)
+            self.levels[z] = level
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels.values())
+
+    def cell_count(self) -> dict:
+        return {z: len(level) for z, level in sorted(self.levels.items())}
+
+    def cells(self, zoom: int, bbox=None, kpis=None, stats=GRID_STATS) -> dict:
+        """
+        Column arrays for the cells at zoom (clamped to the pyramid's range): cell bounds
+        (min_lon/min_lat/max_lon/max_lat), count and <kpi>_<stat>, optionally restricted to
+        cells intersecting bbox = (min_lon, min_lat, max_lon, max_lat).
+        """
+        zoom = min(max(int(zoom), self.min_zoom), self.max_zoom)
+        level = self.levels[zoom]
+        scale = float(2 ** (zoom + self.cell_bits))
+
+        def lon_of(c):
+            return c / scale * 360.0 - 180.0
+
+        def lat_of(c):
+            return np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * c / scale))))
+
+        out = {
+            "min_lon": lon_of(level.cx), "max_lon": lon_of(level.cx + 1),
+            "min_lat": lat_of(level.cy + 1), "max_lat": lat_of(level.cy),
+            "count": level.count,
+        }
+        for name in (kpis if kpis is not None else self.kpis):
+            n, total, lo, hi, hptr, hbin, hcount = level.stats[name]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if "mean" in stats:
+                    out[f"{name}_mean"] = np.where(n > 0, total / np.maximum(n, 1), np.nan)
+            for stat in stats:
+                if stat == "min":
+                    out[f"{name}_min"] = lo
+                elif stat == "max":
+                    out[f"{name}_max"] = hi
+                elif stat == "count":
+                    out[f"{name}_count"] = n
+                elif stat in _QUANTILES:
+                    out[f"{name}_{stat}"] = _hist_quantile(hptr, hbin, hcount, self.edges[name], lo, hi, n,
+                                                           _QUANTILES[stat])
+
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            mask = ((out["max_lon"] >= min_lon) & (out["min_lon"] <= max_lon)
+                    & (out["max_lat"] >= min_lat) & (out["min_lat"] <= max_lat))
+            out = {k: v[mask] for k, v in out.items()}
+        return {"zoom": zoom, **out}
+
+    def to_geojson(self, zoom: int, bbox=None, kpis=None, stats=GRID_STATS, extra: dict = None) -> dict:
+        """FeatureCollection of cell polygons; extra adds property aliases (name → column)."""
+        cols = self.cells(zoom, bbox, kpis, stats)
+        cols.pop("zoom")
+        x0, x1 = cols.pop("min_lon").tolist(), cols.pop("max_lon").tolist()
+        y0, y1 = cols.pop("min_lat").tolist(), cols.pop("max_lat").tolist()
+        names = list(cols)
+        columns = [[None if v != v else v for v in cols[k].tolist()] for k in names]
+        aliases = [(alias, names.index(src)) for alias, src in (extra or {}).items() if src in names]
+        features = []
+        for i in range(len(x0)):
+            props = {name: column[i] for name, column in zip(names, columns)}
+            for alias, j in aliases:
+                props[alias] = columns[j][i]
+            features.append({
+                "type": "Feature",
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[[x1[i], y0[i]], [x1[i], y1[i]], [x0[i], y1[i]], [x0[i], y0[i]], [x1[i], y0[i]]]],
+                },
+                "properties": props,
+            })
+        return {"type": "FeatureCollection", "features": features}
+
+    # === Persistence ===
+    def save(self, path: str):
+        arrays = {
+            "config": np.array([self.min_zoom, self.max_zoom, self.cell_px, self.bins, self.point_count]),
+            "kpis": np.array(self.kpis, dtype=str),
+        }
+        for name, edges in self.edges.items():
+            arrays[f"edges/{name}"] = edges
+        for z, level in self.levels.items():
+            arrays[f"{z}/cx"], arrays[f"{z}/cy"], arrays[f"{z}/count"] = level.cx, level.cy, level.count
+            for i, parts in enumerate(level.stats[name] for name in self.kpis):
+                for part, a in zip(_STAT_PARTS, parts):
+                    arrays[f"{z}/{i}/{part}"] = a
+        tmp = f"{path}.tmp.npz"
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "GridPyramid":
+        with np.load(path, allow_pickle=False) as data:
+            min_zoom, max_zoom, cell_px, bins, point_count = (int(v) for v in data["config"])
+            pyramid = cls(min_zoom=min_zoom, max_zoom=max_zoom, cell_px=cell_px, bins=bins)
+            pyramid.point_count = point_count
+            kpis = [str(k) for k in data["kpis"]]
+            pyramid.edges = {name: data[f"edges/{name}"] for name in kpis}
+            for z in range(min_zoom, max_zoom + 1):
+                stats = {
+                    name: tuple(data[f"{z}/{i}/{part}"] for part in _STAT_PARTS)
+                    for i, name in enumerate(kpis)
+                }
+                pyramid.levels[z] = PyramidLevel(data[f"{z}/cx"], data[f"{z}/cy"], data[f"{z}/count"], stats)
+        return pyramid
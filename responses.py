@@ -0,0 +1,245 @@
+"""
+Shared JSON response layer.
+
+- dumps(): orjson when installed (stdlib json otherwise) with one policy for NumPy/pandas
+  values: NaN/±inf/NA/NaT → null, Timestamps/datetimes → ISO 8601, Decimal → number.
+- gzip/brotli negotiated from Accept-Encoding (brotli only when the module is installed).
+- Serialization/compression time and bytes are sent as Server-Timing / X-Uncompressed-Length
+  headers and accumulated per endpoint in RESPONSE_STATS.
+"""
+import datetime
+import gzip
+import json
+import math
+import os
+import threading
+import time
+import zlib
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import Response, StreamingResponse
+
+from geo_features import widen_float32
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional encoding
+    brotli = None
+
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+RESPONSE_STATS = {}
+_stats_lock = threading.Lock()
+
+
+# === Serialization ===
+def _default(obj):
+    """Values the encoder does not handle natively."""
+    if obj is None or obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, (pd.Timestamp, datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, np.datetime64):
+        return None if np.isnat(obj) else pd.Timestamp(obj).isoformat()
+    if isinstance(obj, (Decimal, float, np.floating)):
+        # float32 via str() keeps its shortest repr (1.1, not 1.100000023841858), as orjson does
+        value = float(str(obj)) if isinstance(obj, (np.float16, np.float32)) else float(obj)
+        return value if math.isfinite(value) else None
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="replace")
+    return str(obj)
+
+
+def _sanitize(obj):
+    """Stdlib fallback: the json module writes NaN/Infinity, so non-finite floats become None first."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sanitize(v) for v in obj]
+    if isinstance(obj, (str, int, bool)) or obj is None:
+        return obj
+    return _sanitize(_default(obj))
+
+
+def dumps(obj) -> bytes:
+    """UTF-8 JSON for obj under the module's NaN/Timestamp policy."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_sanitize(obj), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def frame_records(df: pd.DataFrame) -> list:
+    """df as a list of row dicts with missing values as None (replaces json.loads(df.to_json(orient="records")))."""
+    columns = [str(c) for c in df.columns]
+    if not columns:
+        return [{} for _ in range(len(df))]
+    df = widen_float32(df)
+    values = [df.iloc[:, i].astype(object).where(df.iloc[:, i].notna(), None).tolist() for i in range(df.shape[1])]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+# === Compression ===
+def negotiate_encoding(accept_encoding: str = None):
+    """'br' or 'gzip' when the client accepts it (q > 0), preferring brotli; None otherwise."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+    return body
+
+
+def _compressor(encoding: str):
+    if encoding == "br":
+        c = brotli.Compressor(quality=RESPONSE_BROTLI_QUALITY)
+        return c.process, c.flush, c.finish
+    c = zlib.compressobj(RESPONSE_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+def record_response(name: str, serialize_s: float, compress_s: float, raw_bytes: int, sent_bytes: int,
+                    encoding: str = None):
+    with _stats_lock:
+        s = RESPONSE_STATS.setdefault(name, {
+            "responses": 0, "serialize_ms": 0.0, "compress_ms": 0.0,
+            "raw_bytes": 0, "sent_bytes": 0, "encodings": {},
+        })
+        s["responses"] += 1
+        s["serialize_ms"] += serialize_s * 1000
+        s["compress_ms"] += compress_s * 1000
+        s["raw_bytes"] += raw_bytes
+        s["sent_bytes"] += sent_bytes
+        key = encoding or "identity"
+        s["encodings"][key] = s["encodings"].get(key, 0) + 1
+
+
+def response_stats() -> dict:
+    with _stats_lock:
+        return {
+            name: {**s, "serialize_ms": round(s["serialize_ms"], 1), "compress_ms": round(s["compress_ms"], 1),
+                   "encodings": dict(s["encodings"])}
+            for name, s in RESPONSE_STATS.items()
+        }
+
+
+# === Responses ===
+def _accept_encoding(request) -> str:
+    return request.headers.get("accept-encoding") if request is not None else None
+
+
+def response_encoding(body: bytes, request=None):
+    """The encoding encode_body() will use for body and this request (None = identity)."""
+    if len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return None
+    return negotiate_encoding(_accept_encoding(request))
+
+
+def encode_body(body: bytes, request=None, variants: dict = None):
+    """
+    (payload, encoding, compress_seconds) for body under the request's Accept-Encoding.
+    variants, when given, memoizes encoded payloads per encoding (used by response caches).
+    """
+    encoding = response_encoding(body, request)
+    if encoding is None:
+        return body, None, 0.0
+    if variants is not None and encoding in variants:
+        return variants[encoding], encoding, 0.0
+    t0 = time.perf_counter()
+    payload = compress(body, encoding)
+    elapsed = time.perf_counter() - t0
+    if variants is not None:
+        variants[encoding] = payload
+    return payload, encoding, elapsed
+
+
+def encoded_response(body: bytes, request=None, status_code: int = 200, headers: dict = None,
+                     media_type: str = "application/json", name: str = None, serialize_s: float = 0.0,
+                     variants: dict = None) -> Response:
+    """Response for already-serialized bytes, compressed as negotiated, with timing headers."""
+    payload, encoding, compress_s = encode_body(body, request, variants)
+    out = dict(headers or {})
+    out["Vary"] = "Accept-Encoding"
+    out["X-Uncompressed-Length"] = str(len(body))
+    out["Server-Timing"] = f"serialize;dur={serialize_s * 1000:.1f}, compress;dur={compress_s * 1000:.1f}"
+    if encoding:
+        out["Content-Encoding"] = encoding
+    record_response(name or "other", serialize_s, compress_s, len(body), len(payload), encoding)
+    return Response(content=payload, status_code=status_code, media_type=media_type, headers=out)
+
+
+def json_response(content, request=None, status_code: int = 200, headers: dict = None, name: str = None) -> Response:
+    """JSONResponse replacement: dumps() + negotiated compression + timing headers."""
+    t0 = time.perf_counter()
+    body = dumps(content)
+    return encoded_response(body, request, status_code, headers, name=name, serialize_s=time.perf_counter() - t0)
+
+
+def streaming_response(chunks, request=None, media_type: str = "application/json", headers: dict = None,
+                       name: str = None) -> StreamingResponse:
+    """StreamingResponse whose str/bytes chunks are compressed on the fly (flushed per chunk)."""
+    encoding = negotiate_encoding(_accept_encoding(request))
+    out = dict(headers or {})
+    out["Vary"] = "Accept-Encoding"
+    if encoding is None:
+        return StreamingResponse(chunks, media_type=media_type, headers=out)
+    out["Content-Encoding"] = encoding
+
+    def compressed():
+        process, flush, finish = _compressor(encoding)
+        raw = sent = 0
+        spent = 0.0
+        for chunk in chunks:
+            data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            t0 = time.perf_counter()
+            part = process(data) + flush()
+            spent += time.perf_counter() - t0
+            raw += len(data)
+            sent += len(part)
+            if part:
+                yield part
+        tail = finish()
+        sent += len(tail)
+        record_response(name or "other", 0.0, spent, raw, sent, encoding)
+        if tail:
+            yield tail
+
+    return StreamingResponse(compressed(), media_type=media_type, headers=out)
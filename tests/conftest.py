@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Uploaded datasets, band patterns and tiles go to a throwaway directory
+_TMP = tempfile.mkdtemp(prefix="geolytics-tests-")
+os.environ.setdefault("DATA_DIR", os.path.join(_TMP, "data"))
+os.environ.setdefault("TILE_CACHE_DIR", os.path.join(_TMP, "tile_cache"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
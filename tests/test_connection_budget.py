@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import text
+
+import main
+
+HOST = "budget-test:5432"
+
+
+def _in_use():
+    return main.CONNECTION_BUDGET.snapshot()["hosts"].get(HOST, {}).get("in_use", 0)
+
+
+@pytest.fixture
+def engine():
+    path = os.path.join(tempfile.mkdtemp(), "budget.db")
+    eng = main.create_governed_engine("budget-test", {"url": f"sqlite:///{path}", "host": HOST})
+    yield eng
+    eng.dispose()
+    assert _in_use() == 0
+
+
+def test_checkout_and_checkin(engine):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert _in_use() == 1
+    # Parked in the pool, so still open
+    assert _in_use() == 1
+    assert engine.pool.governor.open_connections == 1
+
+
+def test_overflow_connections_are_released(engine):
+    conns = [engine.connect() for _ in range(main.DB_POOL_SIZE + 2)]
+    assert _in_use() == main.DB_POOL_SIZE + 2
+    for conn in conns:
+        conn.close()
+    # Only pool_size connections are kept; the overflow ones are closed on check-in
+    assert _in_use() == main.DB_POOL_SIZE
+
+
+def test_invalidate_releases_and_reconnect_acquires(engine):
+    with engine.connect() as conn:
+        conn.invalidate()
+        assert _in_use() == 0
+        conn.execute(text("SELECT 1"))
+        assert _in_use() == 1
+
+
+def test_dispose_closes_returned_connections(engine):
+    held = engine.connect()
+    with engine.connect():
+        pass
+    assert _in_use() == 2
+    engine.dispose()
+    # The parked connection is closed; the checked-out one lives until it is returned
+    assert _in_use() == 1
+    held.close()
+    assert _in_use() == 0
+    with engine.connect():
+        assert _in_use() == 1
+
+
+def test_failed_connect_gives_the_slot_back():
+    eng = main.create_governed_engine("budget-test", {"url": "sqlite:////nonexistent/dir/x.db", "host": HOST})
+    with pytest.raises(Exception):
+        eng.connect()
+    assert _in_use() == 0
+
+
+def test_over_budget_times_out(engine):
+    budget = main.CONNECTION_BUDGET
+    limit, timeout = budget.host_limit, engine.pool.governor.timeout
+    budget.host_limit, engine.pool.governor.timeout = 1, 0.2
+    try:
+        with engine.connect():
+            with pytest.raises(main.sa_exc.TimeoutError):
+                engine.connect()
+        assert _in_use() == 1
+    finally:
+        budget.host_limit, engine.pool.governor.timeout = limit, timeout
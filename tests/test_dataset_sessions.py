@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+client = TestClient(main.app)
+
+
+def _drive_test_csv(n: int = 500) -> bytes:
+    rng = np.random.default_rng(7)
+    return pd.DataFrame({
+        "lat": rng.uniform(51.4, 51.6, n),
+        "lon": rng.uniform(-0.2, 0.0, n),
+        "RSRP": np.round(rng.normal(-95, 6, n), 1),
+    }).to_csv(index=False).encode()
+
+
+@pytest.fixture
+def session_dataset():
+    headers = {"X-Session-Id": "alice"}
+    r = client.post("/upload-drive-test", files={"file": ("dt.csv", _drive_test_csv(), "text/csv")}, headers=headers)
+    assert r.status_code == 200, r.text
+    yield r.json()["dataset_id"], headers
+    client.delete(f"/datasets/{r.json()['dataset_id']}", headers=headers)
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/drive-test/clusters", {"zoom": 3}),
+    ("/drive-test/column-range", {"column": "RSRP"}),
+    ("/hex-grid", {"kpi": "RSRP", "size_m": 500}),
+])
+def test_session_upload_is_served(session_dataset, path, params):
+    dataset_id, headers = session_dataset
+    # The session's latest upload and the explicit id both resolve for the owner
+    assert client.get(path, params=params, headers=headers).status_code == 200
+    assert client.get(path, params={**params, "dataset_id": dataset_id}, headers=headers).status_code == 200
+    # Other sessions (and callers without one) never see it
+    assert client.get(path, params={**params, "dataset_id": dataset_id},
+                      headers={"X-Session-Id": "bob"}).status_code == 404
+    assert client.get(path, params={**params, "dataset_id": dataset_id}).status_code == 404
+
+
+def test_rejected_grid_upload_is_not_registered():
+    headers = {"X-Session-Id": "carol"}
+    for body in (b"foo,bar\n1,2\n", b"lat,lon,v\n100,1,2\n"):
+        r = client.post("/upload-grid-map", files={"file": ("g.csv", body, "text/csv")}, headers=headers)
+        assert "dataset_id" not in r.json()
+    assert client.get("/datasets", headers=headers).json()["datasets"] == []
+    assert client.get("/grid-map/column-range", params={"column": "v"}, headers=headers).json() == {"min": None, "max": None}